@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    """Raised when both the running slots and the wait queue are full."""
+
+class Ticket:
+    """A request's place in the admission controller: either running or waiting in line."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._admitted = asyncio.get_running_loop().create_future()
+        self._released = False
+
+    @property
+    def admitted(self) -> bool:
+        return self._admitted.done()
+
+    @property
+    def position(self) -> int:
+        """1-based position in the wait queue, or 0 once admitted."""
+        return 0 if self.admitted else self._controller._waiters.index(self) + 1
+
+    async def wait(self, poll_seconds: float) -> AsyncIterator[int]:
+        """Waits for admission, yielding the queue position whenever it changes."""
+        last_position = None
+        while not self.admitted:
+            if self.position != last_position:
+                last_position = self.position
+                yield last_position
+            try:
+                await asyncio.wait_for(asyncio.shield(self._admitted), timeout=poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self) -> None:
+        """Frees the running slot (or the queue place) and admits the next waiter."""
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self)
+
+class AdmissionController:
+    """
+    Bounds concurrent extractions to `max_concurrency` with a FIFO wait queue of at most `max_queue`.
+    Only used from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiters = deque()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def enqueue(self) -> Ticket:
+        """Admits the request immediately if a slot is free, queues it otherwise, or raises `QueueFull`."""
+        ticket = Ticket(self)
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            ticket._admitted.set_result(True)
+        elif len(self._waiters) >= self.max_queue:
+            raise QueueFull()
+        else:
+            self._waiters.append(ticket)
+            logger.info(f"Extraction queued at position {len(self._waiters)}")
+        return ticket
+
+    async def acquire(self, poll_seconds: float) -> Ticket:
+        """
+        Waits for a running slot, retrying while the wait queue is full instead of
+        raising `QueueFull`. For work that has already been accepted, such as the
+        documents of a batch.
+        """
+        while True:
+            try:
+                ticket = self.enqueue()
+                break
+            except QueueFull:
+                await asyncio.sleep(poll_seconds)
+        try:
+            async for _ in ticket.wait(poll_seconds):
+                pass
+        except BaseException:
+            ticket.release()
+            raise
+        return ticket
+
+    def _release(self, ticket: Ticket) -> None:
+        if ticket.admitted:
+            self._active -= 1
+        else:
+            self._waiters.remove(ticket)
+        while self._active < self.max_concurrency and self._waiters:
+            self._active += 1
+            self._waiters.popleft()._admitted.set_result(True)
@@ -1,270 +1,565 @@
 import os
 import json
+import time
+import operator
+import asyncio
 import logging
 import base64
-from typing import TypedDict, Optional, List, Dict, Any
+import hashlib
+from typing import TypedDict, Annotated, Optional, List, Dict, Any, Awaitable, Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, END
-from io import BytesIO
-from PIL import Image
+import numpy as np
 from langchain_core.messages import HumanMessage
 from . import config
+from .cache import build_cache
+from .llm import get_structured_chain
+from .pdf_text import is_pdf, read_pdf_text_layer, render_pdf_pages
+from .spatial import TokenGridIndex
+from .tokens import TokenStore
+from .serializers import serialize_tokens
+from .layout import analyze_layout
+from .tiling import split_tiles, merge_tiles
+from .preprocess import preprocess_image
+from .retry import call_with_retry, acall_with_retry, is_timeout
+from .checkpoint import build_checkpointer
 from .schema import (
     BoundingBox, WithValue, AreasOfInterest, ExtractedHeader, 
-    LineItem, ExtractedLineItems, ExtractedSummary
+    LineItem, ExtractedLineItems, ExtractedSummary, CompleteInvoice
 )
 
 # --- Configuration ---
 logger = logging.getLogger(__name__)
 GEMINI_MODEL_NAME = config.GEMINI_MODEL_NAME
 
-def filter_ocr_data_by_bbox(ocr_data, bbox_dict):
+def filter_ocr_data_by_bbox(ocr_data: TokenStore, bbox_dict, ocr_index: Optional[TokenGridIndex] = None) -> TokenStore:
     """Filters OCR data to include only items within a given bounding box."""
     if not bbox_dict:
-        return []
-    bbox = BoundingBox(**bbox_dict)
-    filtered_data = [
-        item for item in ocr_data
-        if (item['left'] >= bbox.x1 and item['top'] >= bbox.y1 and
-            (item['left'] + item['width']) <= bbox.x2 and
-            (item['top'] + item['height']) <= bbox.y2)
-    ]
-    return filtered_data
+        return ocr_data.select([])
+    bbox = BoundingBox(**bbox_dict).model_dump()
+    if ocr_index is not None:
+        return ocr_data.select(ocr_index.within(bbox))
+    return ocr_data.select(ocr_data.mask_within(bbox))
+
+def format_ocr_tokens(ocr_data: TokenStore, node: str) -> str:
+    """Serializes OCR tokens for a node's prompt in the format configured for that node."""
+    return serialize_tokens(ocr_data, config.PROMPT_TOKEN_FORMATS.get(node, "verbose"), label=node)
+
+def _area_ocr_text(state, area_key: str, node: str) -> Optional[str]:
+    """Returns the prompt text for the tokens inside an area, or None if the area was not found."""
+    area = (state.get("areas_of_interest") or {}).get(area_key)
+    if not area:
+        return None
+    return format_ocr_tokens(filter_ocr_data_by_bbox(state['ocr_data'], area, state.get('ocr_index')), node)
+
+def _call_report(node: str, attempts: Dict[str, int], error: Optional[Exception] = None) -> Dict[str, Any]:
+    """State update recording a node's Gemini attempts and whether it gave up on a timeout or the deadline."""
+    return {"attempts": attempts, "timed_out": [node] if error is not None and is_timeout(error) else []}
+
+def _dump_result(result) -> Optional[Dict[str, Any]]:
+    """Converts a structured-output Pydantic result into a plain dict."""
+    return result.model_dump() if result else None
+
+def _guarded(state, node: str, work: Callable[[Dict[str, int]], Dict[str, Any]], fallback: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs a node's Gemini work and returns its state update with the call report.
+    `work` gets the node's attempts counter. If it fails, the node degrades to
+    `fallback`, except in checkpointed runs, where the failure is re-raised so
+    that resuming reruns the node.
+    """
+    attempts, error = {}, None
+    try:
+        update = work(attempts)
+    except Exception as e:
+        logger.exception(f"{node} failed, returning empty results")
+        if state.get('resumable'):
+            raise
+        error, update = e, fallback
+    return {**update, **_call_report(node, attempts, error)}
+
+async def _aguarded(state, node: str, work: Callable[[Dict[str, int]], Awaitable[Dict[str, Any]]], fallback: Dict[str, Any]) -> Dict[str, Any]:
+    """Async version of `_guarded`; `work` returns an awaitable."""
+    attempts, error = {}, None
+    try:
+        update = await work(attempts)
+    except Exception as e:
+        logger.exception(f"{node} failed, returning empty results")
+        if state.get('resumable'):
+            raise
+        error, update = e, fallback
+    return {**update, **_call_report(node, attempts, error)}
 
 # --- LangGraph Agent State ---
 
+def _merge_attempts(left: Optional[Dict[str, int]], right: Optional[Dict[str, int]]) -> Dict[str, int]:
+    """Reducer for `attempts`: the fanned-out extractors each report their own node's count."""
+    return {**(left or {}), **(right or {})}
+
 class GraphState(TypedDict):
     """Represents the state of our new agentic workflow."""
-    image_content: bytes
-    ocr_data: List[Dict[str, Any]] 
+    image_content: Optional[bytes]
+    ocr_data: TokenStore
+    ocr_index: Optional[TokenGridIndex]
     areas_of_interest: Optional[AreasOfInterest]
     extracted_header: Optional[ExtractedHeader]
     extracted_line_items: Optional[ExtractedLineItems]
     extracted_summary: Optional[ExtractedSummary]
     extracted_data: Dict[str, Any]
+    # Gemini calls made per node, including retries
+    attempts: Annotated[Dict[str, int], _merge_attempts]
+    # `time.time()` by which the extraction must finish, and the nodes that ran out of budget
+    deadline: Optional[float]
+    timed_out: Annotated[List[str], operator.add]
+    # Checkpointed runs re-raise node failures instead of degrading to empty
+    # results, so that the failed node is the one a resume reruns
+    resumable: bool
 
 # --- Graph Nodes ---
 
-def extract_structured_ocr(state: GraphState):
-    """Extracts structured OCR data from the image using Gemini's native vision capabilities."""
-    logger.info("--- EXTRACTING STRUCTURED OCR DATA (GEMINI VISION) ---")
-    
-    try:
-        # Get image dimensions
-        image_file = BytesIO(state['image_content'])
-        image = Image.open(image_file)
-        width, height = image.size
-
-        # Prepare image for Gemini
-        image_base64 = base64.b64encode(state['image_content']).decode('utf-8')
-
-        # Define schema for the OCR output
-        class OCROutput(TypedDict):
-            tokens: List[Dict[str, Any]]
-
-        ocr_schema = {
-            "title": "OCROutput",
-            "type": "object",
-            "properties": {
-                "tokens": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "text": {"type": "string"},
-                            "ymin": {"type": "integer", "description": "Normalized top edge (0-1000)"},
-                            "xmin": {"type": "integer", "description": "Normalized left edge (0-1000)"},
-                            "ymax": {"type": "integer", "description": "Normalized bottom edge (0-1000)"},
-                            "xmax": {"type": "integer", "description": "Normalized right edge (0-1000)"}
-                        },
-                        "required": ["text", "ymin", "xmin", "ymax", "xmax"]
-                    }
-                }
-            },
-            "required": ["tokens"]
+# Bump whenever OCR_PROMPT, OCR_SCHEMA or the cached token layout changes so
+# stale cache entries are not reused.
+OCR_PROMPT_VERSION = "4"
+
+OCR_PROMPT = "Extract all text tokens from this invoice image. For each token, provide the text and its bounding box in normalized coordinates [ymin, xmin, ymax, xmax] where each value is an integer from 0 to 1000. 0 is the top/left edge and 1000 is the bottom/right edge."
+
+OCR_SCHEMA = {
+    "title": "OCROutput",
+    "type": "object",
+    "properties": {
+        "tokens": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "text": {"type": "string"},
+                    "ymin": {"type": "integer", "description": "Normalized top edge (0-1000)"},
+                    "xmin": {"type": "integer", "description": "Normalized left edge (0-1000)"},
+                    "ymax": {"type": "integer", "description": "Normalized bottom edge (0-1000)"},
+                    "xmax": {"type": "integer", "description": "Normalized right edge (0-1000)"}
+                },
+                "required": ["text", "ymin", "xmin", "ymax", "xmax"]
+            }
         }
+    },
+    "required": ["tokens"]
+}
+
+ocr_cache = build_cache(
+    config.OCR_CACHE_SIZE,
+    config.OCR_CACHE_DB_PATH,
+    config.OCR_CACHE_MAX_AGE_SECONDS,
+    config.OCR_CACHE_MAX_BYTES,
+)
 
-        llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL_NAME, temperature=0)
-        structured_llm = llm.with_structured_output(ocr_schema)
+def ocr_cache_key(image_content: bytes) -> str:
+    """Content-addressed cache key for the OCR output of an image."""
+    digest = hashlib.sha256(image_content).hexdigest()
+    return f"ocr:{GEMINI_MODEL_NAME}:{OCR_PROMPT_VERSION}:{digest}"
 
-        message = HumanMessage(
-            content=[
-                {
-                    "type": "text",
-                    "text": "Extract all text tokens from this invoice image. For each token, provide the text and its bounding box in normalized coordinates [ymin, xmin, ymax, xmax] where each value is an integer from 0 to 1000. 0 is the top/left edge and 1000 is the bottom/right edge."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": f"data:image/jpeg;base64,{image_base64}"
-                }
-            ]
-        )
-
-        result = structured_llm.invoke([message])
-        raw_tokens = result.get("tokens", []) if result else []
-        
-        # Scale normalized coordinates back to pixels
-        ocr_data = []
-        for token in raw_tokens:
-            # Convert normalized [ymin, xmin, ymax, xmax] to pixel [left, top, width, height]
-            left = int((token["xmin"] / 1000) * width)
-            top = int((token["ymin"] / 1000) * height)
-            right = int((token["xmax"] / 1000) * width)
-            bottom = int((token["ymax"] / 1000) * height)
-            
-            ocr_data.append({
-                "text": token["text"],
-                "left": left,
-                "top": top,
-                "width": right - left,
-                "height": bottom - top
-            })
-
-        logger.debug(f"OCR Tokens count: {len(ocr_data)}")
-        return {"ocr_data": ocr_data}
-    except Exception:
-        logger.exception("Error during Gemini Vision OCR extraction")
-        return {"ocr_data": []}
+def _prepare_vision_request(image_content: bytes, prompt: str = OCR_PROMPT):
+    """
+    Builds the Gemini Vision message for an image and returns it with the
+    original image size. The image is preprocessed first; since Gemini answers
+    in normalized coordinates, results map back to the original frame by that size.
+    """
+    image = preprocess_image(image_content)
+
+    # Prepare image for Gemini
+    image_base64 = base64.b64encode(image.content).decode('utf-8')
+
+    message = HumanMessage(
+        content=[
+            {
+                "type": "text",
+                "text": prompt
+            },
+            {
+                "type": "image_url",
+                "image_url": f"data:{image.mime_type};base64,{image_base64}"
+            }
+        ]
+    )
+    return message, image.width, image.height
+
+def _scale_ocr_tokens(result, width: int, height: int) -> TokenStore:
+    """Scales normalized OCR tokens back to pixel coordinates."""
+    raw_tokens = result.get("tokens", []) if result else []
+
+    # Convert normalized [ymin, xmin, ymax, xmax] to pixel [left, top, width, height]
+    xmin, ymin, xmax, ymax = (
+        np.array([token[key] for token in raw_tokens], dtype=np.float64)
+        for key in ("xmin", "ymin", "xmax", "ymax")
+    )
+    left = (xmin / 1000 * width).astype(np.int32)
+    top = (ymin / 1000 * height).astype(np.int32)
+    right = (xmax / 1000 * width).astype(np.int32)
+    bottom = (ymax / 1000 * height).astype(np.int32)
+    ocr_data = TokenStore.from_texts([token["text"] for token in raw_tokens], left, top, right - left, bottom - top)
+
+    logger.debug(f"OCR Tokens count: {len(ocr_data)}")
+    return ocr_data
+
+def _vision_ocr_call(image_content: bytes, attempts: Dict[str, int], deadline: Optional[float] = None) -> TokenStore:
+    """Runs Gemini Vision OCR on a single image with one call."""
+    message, width, height = _prepare_vision_request(image_content)
+    structured_llm = get_structured_chain("extract_structured_ocr", OCR_SCHEMA)
+    result = call_with_retry(
+        "extract_structured_ocr", lambda timeout: structured_llm.invoke([message], timeout=timeout, deadline=deadline), attempts, deadline
+    )
+    return _scale_ocr_tokens(result, width, height)
+
+async def _avision_ocr_call(image_content: bytes, attempts: Dict[str, int], deadline: Optional[float] = None) -> TokenStore:
+    """Async version of `_vision_ocr_call`."""
+    message, width, height = await asyncio.to_thread(_prepare_vision_request, image_content)
+    structured_llm = get_structured_chain("extract_structured_ocr", OCR_SCHEMA)
+    result = await acall_with_retry(
+        "extract_structured_ocr", lambda timeout: structured_llm.ainvoke([message], timeout=timeout, deadline=deadline), attempts, deadline
+    )
+    return _scale_ocr_tokens(result, width, height)
+
+def _ocr_tiles(image_content: bytes) -> Optional[List[Dict[str, Any]]]:
+    """Tiles for a tall stitched image, or None if it should be OCR'd whole."""
+    if not config.OCR_TILING:
+        return None
+    mode = "L" if config.IMAGE_PREPROCESSING and config.IMAGE_GRAYSCALE else "RGB"
+    return split_tiles(image_content, config.OCR_TILE_ASPECT, config.OCR_TILE_OVERLAP, mode)
+
+def _vision_ocr(image_content: bytes, attempts: Dict[str, int], deadline: Optional[float] = None) -> TokenStore:
+    """Runs Gemini Vision OCR on an image; tall images are split into tiles OCR'd concurrently."""
+    tiles = _ocr_tiles(image_content)
+    if tiles is None:
+        return _vision_ocr_call(image_content, attempts, deadline)
+    with ThreadPoolExecutor(max_workers=len(tiles), thread_name_prefix="ocr-tile") as pool:
+        tile_tokens = list(pool.map(lambda tile: _vision_ocr_call(tile["image_content"], attempts, deadline), tiles))
+    return merge_tiles(tile_tokens, tiles)
+
+async def _avision_ocr(image_content: bytes, attempts: Dict[str, int], deadline: Optional[float] = None) -> TokenStore:
+    """Async version of `_vision_ocr`."""
+    tiles = await asyncio.to_thread(_ocr_tiles, image_content)
+    if tiles is None:
+        return await _avision_ocr_call(image_content, attempts, deadline)
+    tile_tokens = await asyncio.gather(*[_avision_ocr_call(tile["image_content"], attempts, deadline) for tile in tiles])
+    return merge_tiles(tile_tokens, tiles)
+
+def _pdf_ocr(pdf_content: bytes, attempts: Dict[str, int], deadline: Optional[float] = None) -> TokenStore:
+    """Reads tokens from the PDF text layer, using vision OCR only for scanned pages."""
+    logger.info("Reading embedded PDF text layer")
+    text_layer, scanned_pages = read_pdf_text_layer(pdf_content, config.PDF_MIN_TEXT_CHARS)
+    stores = [TokenStore.from_dicts(text_layer)]
+    for page in scanned_pages:
+        stores.append(_vision_ocr(page["image_content"], attempts, deadline).shifted(dy=page["top"]))
+    return TokenStore.concat(stores)
+
+async def _apdf_ocr(pdf_content: bytes, attempts: Dict[str, int], deadline: Optional[float] = None) -> TokenStore:
+    """Async version of `_pdf_ocr`; scanned pages are OCR'd concurrently."""
+    logger.info("Reading embedded PDF text layer")
+    text_layer, scanned_pages = await asyncio.to_thread(read_pdf_text_layer, pdf_content, config.PDF_MIN_TEXT_CHARS)
+    page_tokens = await asyncio.gather(*[_avision_ocr(page["image_content"], attempts, deadline) for page in scanned_pages])
+    stores = [TokenStore.from_dicts(text_layer)]
+    for page, tokens in zip(scanned_pages, page_tokens):
+        stores.append(tokens.shifted(dy=page["top"]))
+    return TokenStore.concat(stores)
+
+def _ocr_update(ocr_data: TokenStore) -> Dict[str, Any]:
+    """
+    State update for a finished OCR pass, with the spatial index built once for
+    all region queries. Later nodes only need the tokens, so the upload is
+    dropped from the state here rather than held for the rest of the run.
+    """
+    return {"ocr_data": ocr_data, "ocr_index": TokenGridIndex(ocr_data), "image_content": None}
+
+def _cached_ocr_update(cache_key: str) -> Optional[Dict[str, Any]]:
+    cached = ocr_cache.get(cache_key)
+    if cached is None:
+        return None
+    logger.info("OCR cache hit, skipping Gemini Vision call")
+    return _ocr_update(TokenStore.from_columns(json.loads(cached)))
+
+def _lookup_ocr(image_content: bytes) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """The image's OCR cache key, and the cached state update if there is one."""
+    cache_key = ocr_cache_key(image_content)
+    return cache_key, _cached_ocr_update(cache_key)
+
+def _store_ocr(cache_key: str, ocr_data: TokenStore) -> Dict[str, Any]:
+    # Only successful OCR is cached; failures never get here.
+    ocr_cache.set(cache_key, json.dumps(ocr_data.to_columns()))
+    return _ocr_update(ocr_data)
+
+def extract_structured_ocr(state: GraphState):
+    """Extracts structured OCR data from the image using Gemini's native vision capabilities."""
+    logger.info("--- EXTRACTING STRUCTURED OCR DATA (GEMINI VISION) ---")
+    content = state['image_content']
+    cache_key, cached = _lookup_ocr(content)
+    if cached is not None:
+        return cached
+
+    ocr = _pdf_ocr if is_pdf(content) else _vision_ocr
+    return _guarded(
+        state,
+        "extract_structured_ocr",
+        lambda attempts: _store_ocr(cache_key, ocr(content, attempts, state.get('deadline'))),
+        _ocr_update(TokenStore.from_dicts([])),
+    )
+
+async def aextract_structured_ocr(state: GraphState):
+    """Async version of `extract_structured_ocr`."""
+    logger.info("--- EXTRACTING STRUCTURED OCR DATA (GEMINI VISION) ---")
+    content = state['image_content']
+    # Hashing a large upload and the cache's SQLite tier would block the event loop
+    cache_key, cached = await asyncio.to_thread(_lookup_ocr, content)
+    if cached is not None:
+        return cached
+
+    async def work(attempts):
+        ocr = _apdf_ocr if is_pdf(content) else _avision_ocr
+        ocr_data = await ocr(content, attempts, state.get('deadline'))
+        return await asyncio.to_thread(_store_ocr, cache_key, ocr_data)
+
+    return await _aguarded(state, "extract_structured_ocr", work, _ocr_update(TokenStore.from_dicts([])))
+
+AOI_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert document layout analyst specializing in invoice processing. Your task is to identify the precise bounding boxes (x1, y1, x2, y2) for the primary functional areas of the provided invoice based on OCR tokens.\n\n"
+               "Definitions:\n"
+               "1. **header_area**: Encapsulates identifying metadata: Vendor/Client names, addresses, Invoice Number, Date, and Due Date.\n"
+               "2. **line_items_area**: The core tabular region containing itemized descriptions, quantities, and prices. Must include column headers and all rows.\n"
+               "3. **summary_area**: The bottom section containing Subtotal, Taxes (VAT/GST), and the final Total Amount.\n\n"
+               "Guidelines:\n"
+               "- Bounding boxes must be inclusive of all relevant text. IMPORTANT: The x2 and y2 coordinates must be large enough to contain the full width and height of the last tokens in that area.\n"
+               "- If an area is missing, return null for that specific box.\n"
+               "- Ensure coordinates are consistent with the provided OCR input."),
+    ("human", "OCR Token Data with Full Coordinates:\n{ocr_data}")
+])
+
+def _heuristic_areas(state: GraphState) -> Optional[Dict[str, Any]]:
+    """Returns the local layout analyzer's areas if the configured AOI mode accepts them."""
+    if config.AOI_MODE == "llm":
+        return None
+    areas, confidence = analyze_layout(state['ocr_data'])
+    if config.AOI_MODE == "heuristic" or confidence >= config.AOI_HEURISTIC_MIN_CONFIDENCE:
+        logger.info(f"Using heuristic layout (confidence {confidence:.2f})")
+        return areas
+    logger.info(f"Heuristic layout confidence {confidence:.2f} too low, falling back to LLM")
+    return None
+
+def _areas_update(areas) -> Dict[str, Any]:
+    # with_structured_output returns the Pydantic object directly
+    return {"areas_of_interest": areas.model_dump() if areas else {}}
 
 def decide_aoi(state: GraphState):
     """Identifies the coordinates of key areas of interest."""
     logger.info("--- DECIDING AREAS OF INTEREST ---")
-    ocr_text_with_coords = "\n".join([
-        f"text: '{item['text']}', x1: {item['left']}, y1: {item['top']}, x2: {item['left'] + item['width']}, y2: {item['top'] + item['height']}" 
-        for item in state['ocr_data']
-    ])
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are an expert document layout analyst specializing in invoice processing. Your task is to identify the precise bounding boxes (x1, y1, x2, y2) for the primary functional areas of the provided invoice based on OCR tokens.\n\n"
-                   "Definitions:\n"
-                   "1. **header_area**: Encapsulates identifying metadata: Vendor/Client names, addresses, Invoice Number, Date, and Due Date.\n"
-                   "2. **line_items_area**: The core tabular region containing itemized descriptions, quantities, and prices. Must include column headers and all rows.\n"
-                   "3. **summary_area**: The bottom section containing Subtotal, Taxes (VAT/GST), and the final Total Amount.\n\n"
-                   "Guidelines:\n"
-                   "- Bounding boxes must be inclusive of all relevant text. IMPORTANT: The x2 and y2 coordinates must be large enough to contain the full width and height of the last tokens in that area.\n"
-                   "- If an area is missing, return null for that specific box.\n"
-                   "- Ensure coordinates are consistent with the provided OCR input."),
-        ("human", "OCR Token Data with Full Coordinates:\n{ocr_data}")
-    ])
-    llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL_NAME, temperature=0)
-    structured_llm = llm.with_structured_output(AreasOfInterest)
-    chain = prompt | structured_llm
-    try:
-        areas = chain.invoke({"ocr_data": ocr_text_with_coords})
-        # with_structured_output returns the Pydantic object directly
-        if areas:
-            areas = areas.model_dump()
-        else:
-            areas = {}
-    except Exception:
-        logger.exception("Could not parse LLM output for AOI. Returning empty.")
-        areas = {}
-    return {"areas_of_interest": areas}
-
-def extract_header_data(state: GraphState):
-    """Extracts data from the header area."""
-    logger.info("--- EXTRACTING HEADER DATA ---")
-    header_area = state["areas_of_interest"].get("header_area")
-    if not header_area:
-        return {"extracted_header": None}
-    header_ocr_data = filter_ocr_data_by_bbox(state['ocr_data'], header_area)
-    
-    ocr_text_with_coords = "\n".join([f"text: '{item['text']}', x1: {item['left']}, y1: {item['top']}, x2: {item['left'] + item['width']}, y2: {item['top'] + item['height']}" for item in header_ocr_data])
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a specialized extraction agent for invoice headers. Your goal is to extract key metadata from the provided OCR tokens. For each field, you must provide both the 'value' and a precise 'bbox' (x1, y1, x2, y2) that encompasses the source text.\n\n"
-                   "Fields to Extract:\n"
-                   "- **invoice_number**: The unique ID (often labeled 'Invoice #', 'Bill No', 'Ref').\n"
-                   "- **vendor_name**: Full legal name of the entity issuing the invoice.\n"
-                   "- **client_name**: Full legal name of the entity receiving the invoice.\n"
-                   "- **invoice_date**: Date of issue. Standardize to YYYY-MM-DD if possible.\n"
-                   "- **due_date**: Deadline for payment. Standardize to YYYY-MM-DD if possible.\n\n"
-                   "Instructions:\n"
-                   "- Be extremely precise with bounding boxes; they should tightly wrap the relevant text.\n"
-                   "- IMPORTANT: The 'x2' and 'y2' must reflect the bottom-right corner of the final token in the field (x2 = left + width, y2 = top + height).\n"
-                   "- If a field is not present, return null for its object."),
-        ("human", "Header Area OCR Tokens:\n{ocr_data_with_coords}")
-    ])
-    llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL_NAME, temperature=0)
-    structured_llm = llm.with_structured_output(ExtractedHeader)
-    chain = prompt | structured_llm
-    try:
-        header_data = chain.invoke({"ocr_data_with_coords": ocr_text_with_coords})
-        if header_data:
-            header_data = header_data.model_dump()
-    except Exception:
-        logger.exception("Could not parse LLM output for header extraction. Returning None.")
-        header_data = None
-    return {"extracted_header": header_data}
-
-def extract_line_items_data(state: GraphState):
-    """Extracts data from the line items area."""
-    logger.info("--- EXTRACTING LINE ITEMS DATA ---")
-    line_items_area = state["areas_of_interest"].get("line_items_area")
-    if not line_items_area:
-        return {"extracted_line_items": None}
-    line_items_ocr_data = filter_ocr_data_by_bbox(state['ocr_data'], line_items_area)
-    
-    ocr_text_with_coords = "\n".join([f"text: '{item['text']}', x1: {item['left']}, y1: {item['top']}, x2: {item['left'] + item['width']}, y2: {item['top'] + item['height']}" for item in line_items_ocr_data])
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a specialized agent for itemizing invoice rows. Your task is to extract all line items from the provided OCR data. For each row, you must identify:\n"
-                   "1. **description**: Full text of the service or product. Provide value and field-specific bbox.\n"
-                   "2. **quantity**: Numeric count. Provide value and field-specific bbox.\n"
-                   "3. **unit_price**: Price per unit. Provide value and field-specific bbox.\n"
-                   "4. **total_price**: Line total. Provide value and field-specific bbox.\n"
-                   "5. **bbox**: A single bounding box that encompasses the entire row (all columns).\n\n"
-                   "Precision Guidelines:\n"
-                   "- Ensure each 'LineItem' object represents exactly one row in the invoice table.\n"
-                   "- Bounding boxes must accurately reflect the coordinates in the OCR input. The 'x2' of the row bbox must match the 'x2' of the rightmost column (usually total_price), and 'y2' must match the bottom-most coordinate of that row's tokens.\n"
-                   "- Do not merge adjacent line items."),
-        ("human", "Line Items Area OCR Tokens:\n{ocr_data_with_coords}")
-    ])
-    llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL_NAME, temperature=0)
-    structured_llm = llm.with_structured_output(ExtractedLineItems)
-    chain = prompt | structured_llm
-    try:
-        line_items_data = chain.invoke({"ocr_data_with_coords": ocr_text_with_coords})
-        if line_items_data:
-            line_items_data = line_items_data.model_dump()
-    except Exception:
-        logger.exception("Could not parse LLM output for line items extraction. Returning None.")
-        line_items_data = None
-    return {"extracted_line_items": line_items_data}
-
-def extract_summary_data(state: GraphState):
-    """Extracts data from the summary area."""
-    logger.info("--- EXTRACTING SUMMARY DATA ---")
-    summary_area = state["areas_of_interest"].get("summary_area")
-    if not summary_area:
-        return {"extracted_summary": None}
-    summary_ocr_data = filter_ocr_data_by_bbox(state['ocr_data'], summary_area)
-    
-    ocr_text_with_coords = "\n".join([f"text: '{item['text']}', x1: {item['left']}, y1: {item['top']}, x2: {item['left'] + item['width']}, y2: {item['top'] + item['height']}" for item in summary_ocr_data])
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a specialized agent for invoice summary extraction. Your task is to extract the final financial totals. For each field, provide the 'value' and a precise 'bbox'.\n\n"
-                   "Fields:\n"
-                   "- **total_amount**: The final gross amount due (often 'Grand Total', 'Total', 'Net Payable').\n"
-                   "- **tax_amount**: The total tax applied (often 'VAT', 'GST', 'Sales Tax').\n\n"
-                   "Guidelines:\n"
-                   "- Bounding boxes must tightly wrap the numeric value and any currency symbol if present.\n"
-                   "- Ensure 'x2' and 'y2' include the full width and height of the last digits/tokens to avoid cropping.\n"
-                   "- If a field is missing, return null."),
-        ("human", "Summary Area OCR Tokens:\n{ocr_data_with_coords}")
-    ])
-    llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL_NAME, temperature=0)
-    structured_llm = llm.with_structured_output(ExtractedSummary)
-    chain = prompt | structured_llm
-    try:
-        summary_data = chain.invoke({"ocr_data_with_coords": ocr_text_with_coords})
-        if summary_data:
-            summary_data = summary_data.model_dump()
-    except Exception:
-        logger.exception("Could not parse LLM output for summary extraction. Returning None.")
-        summary_data = None
-    return {"extracted_summary": summary_data}
+    areas = _heuristic_areas(state)
+    if areas is not None:
+        return {"areas_of_interest": areas}
+    ocr_text_with_coords = format_ocr_tokens(state['ocr_data'], "decide_aoi")
+    chain = get_structured_chain("decide_aoi", AreasOfInterest, AOI_PROMPT)
+    return _guarded(state, "decide_aoi", lambda attempts: _areas_update(call_with_retry(
+        "decide_aoi",
+        lambda timeout: chain.invoke({"ocr_data": ocr_text_with_coords}, timeout=timeout, deadline=state.get('deadline')),
+        attempts,
+        state.get('deadline'),
+    )), {"areas_of_interest": {}})
+
+async def adecide_aoi(state: GraphState):
+    """Async version of `decide_aoi`."""
+    logger.info("--- DECIDING AREAS OF INTEREST ---")
+    areas = _heuristic_areas(state)
+    if areas is not None:
+        return {"areas_of_interest": areas}
+    ocr_text_with_coords = format_ocr_tokens(state['ocr_data'], "decide_aoi")
+    chain = get_structured_chain("decide_aoi", AreasOfInterest, AOI_PROMPT)
+
+    async def work(attempts):
+        return _areas_update(await acall_with_retry(
+            "decide_aoi",
+            lambda timeout: chain.ainvoke({"ocr_data": ocr_text_with_coords}, timeout=timeout, deadline=state.get('deadline')),
+            attempts,
+            state.get('deadline'),
+        ))
+
+    return await _aguarded(state, "decide_aoi", work, {"areas_of_interest": {}})
+
+def build_extractor(node: str, label: str, area_key: str, result_key: str, schema, prompt: ChatPromptTemplate):
+    """
+    Builds the sync and async nodes of a targeted extractor: the tokens inside
+    `area_key` go through `prompt` and the `schema` result lands in `result_key`.
+    """
+    def extract(state: GraphState):
+        logger.info(f"--- EXTRACTING {label} DATA ---")
+        ocr_text_with_coords = _area_ocr_text(state, area_key, node)
+        if ocr_text_with_coords is None:
+            return {result_key: None}
+        chain = get_structured_chain(node, schema, prompt)
+        return _guarded(state, node, lambda attempts: {result_key: _dump_result(call_with_retry(
+            node,
+            lambda timeout: chain.invoke({"ocr_data_with_coords": ocr_text_with_coords}, timeout=timeout, deadline=state.get('deadline')),
+            attempts,
+            state.get('deadline'),
+        ))}, {result_key: None})
+
+    async def aextract(state: GraphState):
+        logger.info(f"--- EXTRACTING {label} DATA ---")
+        ocr_text_with_coords = _area_ocr_text(state, area_key, node)
+        if ocr_text_with_coords is None:
+            return {result_key: None}
+        chain = get_structured_chain(node, schema, prompt)
+
+        async def work(attempts):
+            return {result_key: _dump_result(await acall_with_retry(
+                node,
+                lambda timeout: chain.ainvoke({"ocr_data_with_coords": ocr_text_with_coords}, timeout=timeout, deadline=state.get('deadline')),
+                attempts,
+                state.get('deadline'),
+            ))}
+
+        return await _aguarded(state, node, work, {result_key: None})
+
+    extract.__name__, aextract.__name__ = node, f"a{node}"
+    extract.__doc__ = f"Extracts data from the {area_key.replace('_', ' ')}."
+    aextract.__doc__ = f"Async version of `{node}`."
+    return extract, aextract
+
+HEADER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a specialized extraction agent for invoice headers. Your goal is to extract key metadata from the provided OCR tokens. For each field, you must provide both the 'value' and a precise 'bbox' (x1, y1, x2, y2) that encompasses the source text.\n\n"
+               "Fields to Extract:\n"
+               "- **invoice_number**: The unique ID (often labeled 'Invoice #', 'Bill No', 'Ref').\n"
+               "- **vendor_name**: Full legal name of the entity issuing the invoice.\n"
+               "- **client_name**: Full legal name of the entity receiving the invoice.\n"
+               "- **invoice_date**: Date of issue. Standardize to YYYY-MM-DD if possible.\n"
+               "- **due_date**: Deadline for payment. Standardize to YYYY-MM-DD if possible.\n\n"
+               "Instructions:\n"
+               "- Be extremely precise with bounding boxes; they should tightly wrap the relevant text.\n"
+               "- IMPORTANT: The 'x2' and 'y2' must reflect the bottom-right corner of the final token in the field (x2 = left + width, y2 = top + height).\n"
+               "- If a field is not present, return null for its object."),
+    ("human", "Header Area OCR Tokens:\n{ocr_data_with_coords}")
+])
+
+extract_header_data, aextract_header_data = build_extractor(
+    "extract_header_data", "HEADER", "header_area", "extracted_header", ExtractedHeader, HEADER_PROMPT
+)
+
+LINE_ITEMS_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a specialized agent for itemizing invoice rows. Your task is to extract all line items from the provided OCR data. For each row, you must identify:\n"
+               "1. **description**: Full text of the service or product. Provide value and field-specific bbox.\n"
+               "2. **quantity**: Numeric count. Provide value and field-specific bbox.\n"
+               "3. **unit_price**: Price per unit. Provide value and field-specific bbox.\n"
+               "4. **total_price**: Line total. Provide value and field-specific bbox.\n"
+               "5. **bbox**: A single bounding box that encompasses the entire row (all columns).\n\n"
+               "Precision Guidelines:\n"
+               "- Ensure each 'LineItem' object represents exactly one row in the invoice table.\n"
+               "- Bounding boxes must accurately reflect the coordinates in the OCR input. The 'x2' of the row bbox must match the 'x2' of the rightmost column (usually total_price), and 'y2' must match the bottom-most coordinate of that row's tokens.\n"
+               "- Do not merge adjacent line items."),
+    ("human", "Line Items Area OCR Tokens:\n{ocr_data_with_coords}")
+])
+
+extract_line_items_data, aextract_line_items_data = build_extractor(
+    "extract_line_items_data", "LINE ITEMS", "line_items_area", "extracted_line_items", ExtractedLineItems, LINE_ITEMS_PROMPT
+)
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a specialized agent for invoice summary extraction. Your task is to extract the final financial totals. For each field, provide the 'value' and a precise 'bbox'.\n\n"
+               "Fields:\n"
+               "- **total_amount**: The final gross amount due (often 'Grand Total', 'Total', 'Net Payable').\n"
+               "- **tax_amount**: The total tax applied (often 'VAT', 'GST', 'Sales Tax').\n\n"
+               "Guidelines:\n"
+               "- Bounding boxes must tightly wrap the numeric value and any currency symbol if present.\n"
+               "- Ensure 'x2' and 'y2' include the full width and height of the last digits/tokens to avoid cropping.\n"
+               "- If a field is missing, return null."),
+    ("human", "Summary Area OCR Tokens:\n{ocr_data_with_coords}")
+])
+
+extract_summary_data, aextract_summary_data = build_extractor(
+    "extract_summary_data", "SUMMARY", "summary_area", "extracted_summary", ExtractedSummary, SUMMARY_PROMPT
+)
+
+COMBINED_PROMPT = (
+    "You are an expert invoice extraction agent. Read this invoice image and extract the complete invoice in one pass. "
+    "For each field, provide both the 'value' and a 'bbox' (x1, y1, x2, y2) that tightly wraps the source text, using "
+    "normalized coordinates where each value is an integer from 0 to 1000 (0 is the top/left edge, 1000 the bottom/right edge).\n\n"
+    "Fields:\n"
+    "- **invoice_number**: The unique ID (often labeled 'Invoice #', 'Bill No', 'Ref').\n"
+    "- **vendor_name**: Full legal name of the entity issuing the invoice.\n"
+    "- **client_name**: Full legal name of the entity receiving the invoice.\n"
+    "- **invoice_date**: Date of issue. Standardize to YYYY-MM-DD if possible.\n"
+    "- **due_date**: Deadline for payment. Standardize to YYYY-MM-DD if possible.\n"
+    "- **total_amount**: The final gross amount due (often 'Grand Total', 'Total', 'Net Payable').\n"
+    "- **tax_amount**: The total tax applied (often 'VAT', 'GST', 'Sales Tax').\n"
+    "- **line_items**: One entry per table row with description, quantity, unit_price and total_price, each with its own bbox, "
+    "plus a row 'bbox' spanning all columns. Do not merge adjacent rows.\n\n"
+    "If a field is not present, return null for it."
+)
+
+def _scale_bbox(bbox: Optional[Dict[str, int]], width: int, height: int) -> Optional[Dict[str, int]]:
+    """Scales a normalized (0-1000) bbox to pixel coordinates."""
+    if not bbox:
+        return bbox
+    return {
+        "x1": int(bbox["x1"] / 1000 * width),
+        "y1": int(bbox["y1"] / 1000 * height),
+        "x2": int(bbox["x2"] / 1000 * width),
+        "y2": int(bbox["y2"] / 1000 * height),
+    }
+
+def _split_complete_invoice(invoice: Optional[Dict[str, Any]], width: int, height: int) -> Dict[str, Any]:
+    """Scales a `CompleteInvoice` to pixels and splits it into the per-extractor state keys."""
+    if not invoice:
+        return {"extracted_header": None, "extracted_line_items": None, "extracted_summary": None}
+    for field in list(ExtractedHeader.model_fields) + list(ExtractedSummary.model_fields):
+        if invoice.get(field):
+            invoice[field]["bbox"] = _scale_bbox(invoice[field].get("bbox"), width, height)
+    for item in invoice.get("line_items") or []:
+        item["bbox"] = _scale_bbox(item.get("bbox"), width, height)
+        for field in ("description", "quantity", "unit_price", "total_price"):
+            if item.get(field):
+                item[field]["bbox"] = _scale_bbox(item[field].get("bbox"), width, height)
+    return {
+        "extracted_header": {field: invoice.get(field) for field in ExtractedHeader.model_fields},
+        "extracted_line_items": {"line_items": invoice.get("line_items") or []},
+        "extracted_summary": {field: invoice.get(field) for field in ExtractedSummary.model_fields},
+    }
+
+def _combined_image(content: bytes) -> bytes:
+    """The image sent to the combined extractor; PDFs are rendered into one stitched page image."""
+    return render_pdf_pages(content) if is_pdf(content) else content
+
+def _complete_invoice_update(invoice, width: int, height: int) -> Dict[str, Any]:
+    return _split_complete_invoice(_dump_result(invoice), width, height)
+
+def extract_complete_invoice(state: GraphState):
+    """Extracts the whole invoice directly from the image with a single vision call."""
+    logger.info("--- EXTRACTING COMPLETE INVOICE (SINGLE CALL) ---")
+
+    def work(attempts):
+        message, width, height = _prepare_vision_request(_combined_image(state['image_content']), COMBINED_PROMPT)
+        chain = get_structured_chain("extract_complete_invoice", CompleteInvoice)
+        return _complete_invoice_update(call_with_retry(
+            "extract_complete_invoice",
+            lambda timeout: chain.invoke([message], timeout=timeout, deadline=state.get('deadline')),
+            attempts,
+            state.get('deadline'),
+        ), width, height)
+
+    update = _guarded(state, "extract_complete_invoice", work, _split_complete_invoice(None, 0, 0))
+    return {**update, "image_content": None}
+
+async def aextract_complete_invoice(state: GraphState):
+    """Async version of `extract_complete_invoice`."""
+    logger.info("--- EXTRACTING COMPLETE INVOICE (SINGLE CALL) ---")
+
+    async def work(attempts):
+        image_content = await asyncio.to_thread(_combined_image, state['image_content'])
+        message, width, height = await asyncio.to_thread(_prepare_vision_request, image_content, COMBINED_PROMPT)
+        chain = get_structured_chain("extract_complete_invoice", CompleteInvoice)
+        return _complete_invoice_update(await acall_with_retry(
+            "extract_complete_invoice",
+            lambda timeout: chain.ainvoke([message], timeout=timeout, deadline=state.get('deadline')),
+            attempts,
+            state.get('deadline'),
+        ), width, height)
+
+    update = await _aguarded(state, "extract_complete_invoice", work, _split_complete_invoice(None, 0, 0))
+    return {**update, "image_content": None}
 
 def aggregate_results(state: GraphState):
     """Aggregates results from all extractors into the final JSON."""
@@ -302,46 +597,215 @@ def aggregate_results(state: GraphState):
     else:
         final_data["line_items"] = []
 
+    # Stages cut short by the deadline: return what was extracted, flagged as partial
+    timed_out = state.get("timed_out") or []
+    if timed_out:
+        final_data["partial"] = True
+        final_data["missing_stages"] = sorted(set(timed_out))
+
     return {"extracted_data": final_data}
 
 # --- Graph Definition ---
-workflow = StateGraph(GraphState)
-
-# Add nodes
-workflow.add_node("extract_structured_ocr", extract_structured_ocr)
-workflow.add_node("decide_aoi", decide_aoi)
-workflow.add_node("extract_header_data", extract_header_data)
-workflow.add_node("extract_line_items_data", extract_line_items_data)
-workflow.add_node("extract_summary_data", extract_summary_data)
-workflow.add_node("aggregate_results", aggregate_results)
-
-# Define edges
-workflow.set_entry_point("extract_structured_ocr")
-workflow.add_edge("extract_structured_ocr", "decide_aoi")
-workflow.add_edge("decide_aoi", "extract_header_data")
-workflow.add_edge("extract_header_data", "extract_line_items_data")
-workflow.add_edge("extract_line_items_data", "extract_summary_data")
-workflow.add_edge("extract_summary_data", "aggregate_results")
-workflow.add_edge("aggregate_results", END)
-
-
-# Compile the graph
-agent = workflow.compile()
-
-def run_agent(image_content: bytes) -> dict:
+
+# The three extractors only read `areas_of_interest` and `ocr_data` and write
+# disjoint keys, so they fan out from `decide_aoi` and run in the same superstep.
+# `aggregate_results` waits for all of them before running.
+EXTRACTOR_NODES = ["extract_header_data", "extract_line_items_data", "extract_summary_data"]
+
+def build_workflow(nodes: Dict[str, Callable]) -> StateGraph:
+    """Wires the given node implementations into the extraction graph."""
+    workflow = StateGraph(GraphState)
+
+    # Add nodes
+    for name in ["extract_structured_ocr", "decide_aoi", *EXTRACTOR_NODES, "aggregate_results"]:
+        workflow.add_node(name, nodes[name])
+
+    # Define edges
+    workflow.set_entry_point("extract_structured_ocr")
+    workflow.add_edge("extract_structured_ocr", "decide_aoi")
+    for node in EXTRACTOR_NODES:
+        workflow.add_edge("decide_aoi", node)
+    workflow.add_edge(EXTRACTOR_NODES, "aggregate_results")
+    workflow.add_edge("aggregate_results", END)
+    return workflow
+
+def build_combined_workflow(nodes: Dict[str, Callable]) -> StateGraph:
+    """
+    Wires the latency-optimized graph: one vision call returns the whole
+    invoice, then `aggregate_results` produces the usual output shape.
+    """
+    workflow = StateGraph(GraphState)
+    workflow.add_node("extract_complete_invoice", nodes["extract_complete_invoice"])
+    workflow.add_node("aggregate_results", nodes["aggregate_results"])
+    workflow.set_entry_point("extract_complete_invoice")
+    workflow.add_edge("extract_complete_invoice", "aggregate_results")
+    workflow.add_edge("aggregate_results", END)
+    return workflow
+
+SYNC_NODES = {
+    "extract_structured_ocr": extract_structured_ocr,
+    "decide_aoi": decide_aoi,
+    "extract_header_data": extract_header_data,
+    "extract_line_items_data": extract_line_items_data,
+    "extract_summary_data": extract_summary_data,
+    "extract_complete_invoice": extract_complete_invoice,
+    "aggregate_results": aggregate_results,
+}
+
+ASYNC_NODES = {
+    "extract_structured_ocr": aextract_structured_ocr,
+    "decide_aoi": adecide_aoi,
+    "extract_header_data": aextract_header_data,
+    "extract_line_items_data": aextract_line_items_data,
+    "extract_summary_data": aextract_summary_data,
+    "extract_complete_invoice": aextract_complete_invoice,
+    "aggregate_results": aggregate_results,
+}
+
+# State keys that hold inputs or in-process helpers rather than results; they are not streamed to clients.
+PRIVATE_STATE_KEYS = {"image_content", "ocr_index"}
+
+def _public_value(value):
+    """Converts in-process containers to their JSON-friendly form."""
+    return value.to_dicts() if isinstance(value, TokenStore) else value
+
+def _public_update(output: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Strips private state keys from a streamed node update, and entries that
+    are not node updates (e.g. the `__metadata__` LangGraph adds on resume).
+    """
+    return {
+        node: {key: _public_value(value) for key, value in (update or {}).items() if key not in PRIVATE_STATE_KEYS}
+        for node, update in output.items()
+        if node in SYNC_NODES
+    }
+
+# Compile the graphs. The sync graphs run nodes in threads; the async ones await
+# the chat model directly and must be driven with `ainvoke` / `astream`.
+# "standard" is the multi-stage OCR -> AOI -> extractors pipeline, "combined"
+# the single-call path for simple invoices.
+agent = build_workflow(SYNC_NODES).compile()
+async_agent = build_workflow(ASYNC_NODES).compile()
+combined_agent = build_combined_workflow(SYNC_NODES).compile()
+async_combined_agent = build_combined_workflow(ASYNC_NODES).compile()
+
+GRAPHS = {"standard": agent, "combined": combined_agent}
+ASYNC_GRAPHS = {"standard": async_agent, "combined": async_combined_agent}
+PIPELINES = tuple(GRAPHS)
+
+# With CHECKPOINT_DB_PATH set, runs given a thread id use copies of the graphs
+# that checkpoint every step, so a failed run can be resumed on that thread id
+# and only redoes the nodes that had not completed.
+checkpointer = build_checkpointer(config.CHECKPOINT_DB_PATH) if config.CHECKPOINT_DB_PATH else None
+WORKFLOW_BUILDERS = {"standard": build_workflow, "combined": build_combined_workflow}
+if checkpointer is not None:
+    RESUMABLE_GRAPHS = {name: build(SYNC_NODES).compile(checkpointer=checkpointer) for name, build in WORKFLOW_BUILDERS.items()}
+    ASYNC_RESUMABLE_GRAPHS = {name: build(ASYNC_NODES).compile(checkpointer=checkpointer) for name, build in WORKFLOW_BUILDERS.items()}
+else:
+    RESUMABLE_GRAPHS, ASYNC_RESUMABLE_GRAPHS = {}, {}
+
+def _thread_config(thread_id: str) -> Dict[str, Any]:
+    if checkpointer is None:
+        raise ValueError("Checkpointing is disabled; set CHECKPOINT_DB_PATH to run with a thread id.")
+    return {"configurable": {"thread_id": thread_id}}
+
+def _initial_state(image_content: bytes, thread_id: Optional[str] = None) -> Dict[str, Any]:
+    """Graph input for one extraction, with its end-to-end deadline starting now."""
+    if thread_id is None:
+        return {"image_content": image_content, "deadline": time.time() + config.EXTRACTION_DEADLINE_SECONDS}
+    # A checkpointed run has no overall deadline: a stage that fails is resumed later rather than
+    # returned partial. The upload is copied out of any memory map so the checkpoint can store it.
+    return {"image_content": bytes(image_content), "deadline": None, "resumable": True}
+
+def _graph(pipeline: str, thread_id: Optional[str]):
+    return GRAPHS[pipeline] if thread_id is None else RESUMABLE_GRAPHS[pipeline]
+
+def _agraph(pipeline: str, thread_id: Optional[str]):
+    return ASYNC_GRAPHS[pipeline] if thread_id is None else ASYNC_RESUMABLE_GRAPHS[pipeline]
+
+def _finish_thread(thread_id: Optional[str]) -> None:
+    """Drops a completed run's checkpoints; only failed runs need them."""
+    if thread_id is not None:
+        checkpointer.delete_thread(thread_id)
+
+def run_agent(image_content: bytes, pipeline: str = "standard", thread_id: Optional[str] = None) -> dict:
     """
     Runs the invoice extraction agentic workflow (Synchronous version).
+    With a `thread_id` the run is checkpointed and can be resumed with `resume_agent` if it fails.
     """
-    initial_state = {"image_content": image_content}
-    final_state = agent.invoke(initial_state)
+    run_config = _thread_config(thread_id) if thread_id is not None else None
+    initial_state = _initial_state(image_content, thread_id)
+    final_state = _graph(pipeline, thread_id).invoke(initial_state, run_config)
+    _finish_thread(thread_id)
     extracted_data = final_state.get("extracted_data", {})
     return extracted_data
 
-def run_agent_stream(image_content: bytes):
+def run_agent_stream(image_content: bytes, pipeline: str = "standard", thread_id: Optional[str] = None):
     """
     Runs the invoice extraction agentic workflow and yields updates as they occur.
     """
-    initial_state = {"image_content": image_content}
-    for output in agent.stream(initial_state):
+    run_config = _thread_config(thread_id) if thread_id is not None else None
+    initial_state = _initial_state(image_content, thread_id)
+    del image_content
+    for output in _graph(pipeline, thread_id).stream(initial_state, run_config):
+        # The graph has copied its input into state by now; dropping our reference lets
+        # the upload be freed as soon as OCR clears it from the state.
+        initial_state.pop("image_content", None)
         # output is a dict with node name as key and its return value as value
-        yield output
+        yield _public_update(output)
+    _finish_thread(thread_id)
+
+async def arun_agent(image_content: bytes, pipeline: str = "standard", thread_id: Optional[str] = None) -> dict:
+    """
+    Runs the invoice extraction agentic workflow (Asynchronous version).
+    """
+    run_config = _thread_config(thread_id) if thread_id is not None else None
+    initial_state = _initial_state(image_content, thread_id)
+    final_state = await _agraph(pipeline, thread_id).ainvoke(initial_state, run_config)
+    if thread_id is not None:
+        await checkpointer.adelete_thread(thread_id)
+    return final_state.get("extracted_data", {})
+
+async def run_agent_astream(image_content: bytes, pipeline: str = "standard", thread_id: Optional[str] = None):
+    """
+    Async counterpart of `run_agent_stream`, yielding node updates without tying up a thread.
+    """
+    run_config = _thread_config(thread_id) if thread_id is not None else None
+    initial_state = _initial_state(image_content, thread_id)
+    del image_content
+    async for output in _agraph(pipeline, thread_id).astream(initial_state, run_config):
+        initial_state.pop("image_content", None)
+        yield _public_update(output)
+    if thread_id is not None:
+        await checkpointer.adelete_thread(thread_id)
+
+# --- Resuming Checkpointed Runs ---
+# A run started with a thread id that failed (or whose process died) keeps its
+# checkpoints. Resuming invokes the graph on that thread with no input, which
+# reruns only the nodes that had not completed, reusing everything else.
+
+def _unfinished(snapshot, thread_id: str) -> None:
+    if not snapshot.next:
+        raise ValueError(f"No unfinished run to resume for thread '{thread_id}'.")
+
+def resume_agent(thread_id: str, pipeline: str = "standard") -> dict:
+    """
+    Resumes a failed checkpointed run from its last completed nodes and returns the extracted data.
+    """
+    run_config = _thread_config(thread_id)
+    graph = RESUMABLE_GRAPHS[pipeline]
+    _unfinished(graph.get_state(run_config), thread_id)
+    final_state = graph.invoke(None, run_config)
+    _finish_thread(thread_id)
+    return final_state.get("extracted_data", {})
+
+async def resume_agent_astream(thread_id: str, pipeline: str = "standard"):
+    """
+    Async counterpart of `resume_agent`, yielding the updates of the nodes that are rerun.
+    """
+    run_config = _thread_config(thread_id)
+    graph = ASYNC_RESUMABLE_GRAPHS[pipeline]
+    _unfinished(await graph.aget_state(run_config), thread_id)
+    async for output in graph.astream(None, run_config):
+        yield _public_update(output)
+    await checkpointer.adelete_thread(thread_id)
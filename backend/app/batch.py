@@ -0,0 +1,160 @@
+import io
+import mmap
+import time
+import asyncio
+import logging
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple, Union
+from . import config, metrics
+from .admission import AdmissionController
+from .agent import run_agent, arun_agent
+from .pdf_text import is_pdf
+from .preprocess import is_image
+
+logger = logging.getLogger(__name__)
+
+# --- Batch Extraction ---
+# Many documents are pushed through one bounded pool of BATCH_CONCURRENCY
+# workers. Gemini calls from every worker (and every other request) share the
+# process-wide per-model rate limiter, so a batch runs as fast as the quota
+# allows. In the server, each document also takes an admission slot, so
+# batches share MAX_CONCURRENT_EXTRACTIONS with single extractions. Documents
+# are pulled from the input lazily, at most one per free worker, and results
+# are yielded in completion order. Anything that is neither an image nor a
+# PDF fails without being extracted.
+
+# A document's content may instead be the exception raised while reading it,
+# which is then reported as that document's failure.
+Document = Tuple[str, Union[bytes, mmap.mmap, Exception]]
+
+def _result(index: int, name: str, started: float, extracted_data: Optional[Dict[str, Any]] = None,
+            error: Optional[BaseException] = None) -> Dict[str, Any]:
+    result = {
+        "index": index,
+        "filename": name,
+        "status": "failed" if error is not None else "completed",
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    if error is not None:
+        metrics.increment("batch_documents_failed")
+        logger.warning(f"Batch document {name} failed: {error}")
+        result["error"] = str(error)
+    else:
+        metrics.increment("batch_documents_completed")
+        result["extracted_data"] = extracted_data
+    return result
+
+def _check_document(content) -> None:
+    """Raises the error a document was read with, or a `ValueError` if it is not an image or a PDF."""
+    if isinstance(content, Exception):
+        raise content
+    if not is_pdf(content) and not is_image(content):
+        raise ValueError("Unsupported document type; expected an image or a PDF.")
+
+def _extract(index: int, name: str, content, pipeline: str) -> Dict[str, Any]:
+    started = time.monotonic()
+    try:
+        _check_document(content)
+        return _result(index, name, started, run_agent(content, pipeline))
+    except Exception as e:
+        return _result(index, name, started, error=e)
+
+def run_agent_batch(documents: Iterable[Document], pipeline: str = "standard",
+                    concurrency: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Runs `run_agent` over `(filename, content)` pairs on a pool of
+    `concurrency` threads, yielding one result dict per document as it
+    finishes. A failing document yields a `failed` result instead of
+    stopping the batch.
+    """
+    concurrency = concurrency or config.BATCH_CONCURRENCY
+    documents = iter(enumerate(documents))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        pending = set()
+        while True:
+            # Keep exactly one document per worker in flight so the input is read lazily
+            for index, (name, content) in documents:
+                pending.add(pool.submit(_extract, index, name, content, pipeline))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+async def arun_agent_batch(documents: Iterable[Document], pipeline: str = "standard",
+                           concurrency: Optional[int] = None,
+                           admission: Optional[AdmissionController] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async counterpart of `run_agent_batch`, running `concurrency` worker
+    tasks on the async graph. Documents are drawn from the iterable in a
+    worker thread, so a lazily decompressing source does not block the loop.
+    With `admission`, every document waits for a slot before it is extracted.
+    Closing the generator cancels the workers.
+    """
+    concurrency = concurrency or config.BATCH_CONCURRENCY
+    documents = iter(enumerate(documents))
+    results: asyncio.Queue = asyncio.Queue()
+    lock = asyncio.Lock()
+    finished = object()
+
+    async def next_document():
+        async with lock:
+            return await asyncio.to_thread(next, documents, None)
+
+    async def worker():
+        try:
+            while (item := await next_document()) is not None:
+                index, (name, content) = item
+                started = time.monotonic()
+                ticket = None
+                try:
+                    _check_document(content)
+                    if admission is not None:
+                        ticket = await admission.acquire(config.ADMISSION_POLL_SECONDS)
+                    result = _result(index, name, started, await arun_agent(content, pipeline))
+                except Exception as e:
+                    result = _result(index, name, started, error=e)
+                finally:
+                    if ticket is not None:
+                        ticket.release()
+                del item, content
+                await results.put(result)
+        except Exception as e:
+            # The document source itself failed; nothing more can be read from it
+            logger.exception("Reading batch documents failed")
+            await results.put(e)
+        finally:
+            await results.put(finished)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        running = len(workers)
+        while running:
+            result = await results.get()
+            if result is finished:
+                running -= 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                yield result
+    finally:
+        for task in workers:
+            task.cancel()
+
+def iter_archive(content, max_member_bytes: int) -> Iterator[Document]:
+    """
+    Yields `(filename, content)` for every file in a ZIP archive, skipping
+    directories and macOS metadata. Members whose uncompressed size is over
+    `max_member_bytes` are not inflated and come back as a `ValueError`.
+    """
+    with zipfile.ZipFile(io.BytesIO(content) if isinstance(content, bytes) else content) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or member.filename.startswith("__MACOSX/"):
+                continue
+            if member.file_size > max_member_bytes:
+                yield member.filename, ValueError(f"Archive member is larger than {max_member_bytes} bytes.")
+                continue
+            yield member.filename, archive.read(member)
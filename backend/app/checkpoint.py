@@ -0,0 +1,53 @@
+import os
+import asyncio
+import sqlite3
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from .tokens import TokenStore
+from .spatial import TokenGridIndex
+
+logger = logging.getLogger(__name__)
+
+# --- Graph Checkpointing ---
+# With a checkpointer, LangGraph saves the state after every step, and the
+# writes of nodes that succeeded in a step whose sibling failed. Invoking the
+# graph again on the same thread id with no input then only runs the nodes
+# that have not completed yet.
+
+# In-process state types the serializer may rebuild; anything else is refused on load
+CHECKPOINT_TYPES = (TokenStore, TokenGridIndex)
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver whose async methods run the sync ones in a worker thread, so
+    the sync and async graphs can share one saver that is not tied to an event loop.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter: Optional[Dict[str, Any]] = None, before=None,
+                    limit: Optional[int] = None) -> AsyncIterator:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+def build_checkpointer(path: str) -> ThreadedSqliteSaver:
+    """Opens (creating if needed) the SQLite checkpoint database at `path`."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    serde = JsonPlusSerializer(allowed_msgpack_modules=[(cls.__module__, cls.__name__) for cls in CHECKPOINT_TYPES])
+    logger.info(f"Checkpointing graph runs to {path}")
+    return ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False), serde=serde)
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -21,3 +22,117 @@ validate_config()
 # Export variables
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.5-flash")
+
+# OCR result cache: an in-memory LRU tier plus an optional SQLite tier on disk
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "128"))
+OCR_CACHE_DB_PATH = os.getenv("OCR_CACHE_DB_PATH")
+OCR_CACHE_MAX_AGE_SECONDS = int(os.getenv("OCR_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Digital PDFs are read from their text layer; pages with fewer characters than
+# this are treated as scanned and sent to vision OCR.
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "20"))
+
+# How OCR tokens are serialized into prompts: "verbose", "table" or "lines".
+# PROMPT_TOKEN_FORMAT sets the default; PROMPT_TOKEN_FORMAT_<NODE> overrides it per node.
+PROMPT_TOKEN_FORMAT = os.getenv("PROMPT_TOKEN_FORMAT", "verbose")
+PROMPT_TOKEN_FORMATS = {
+    node: os.getenv(f"PROMPT_TOKEN_FORMAT_{node.upper()}", PROMPT_TOKEN_FORMAT)
+    for node in ("decide_aoi", "extract_header_data", "extract_line_items_data", "extract_summary_data")
+}
+
+# How `decide_aoi` finds the areas of interest: "llm" always asks Gemini,
+# "heuristic" always uses the local layout analyzer, and "auto" uses the
+# analyzer when its confidence reaches AOI_HEURISTIC_MIN_CONFIDENCE.
+AOI_MODE = os.getenv("AOI_MODE", "llm")
+AOI_HEURISTIC_MIN_CONFIDENCE = float(os.getenv("AOI_HEURISTIC_MIN_CONFIDENCE", "0.8"))
+
+# How often a streaming extraction checks whether its client has disconnected.
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1.0"))
+
+# Admission control for /api/extract-invoice: at most MAX_CONCURRENT_EXTRACTIONS
+# run at once, up to MAX_QUEUED_EXTRACTIONS wait, and the rest get a 503.
+MAX_CONCURRENT_EXTRACTIONS = int(os.getenv("MAX_CONCURRENT_EXTRACTIONS", "4"))
+MAX_QUEUED_EXTRACTIONS = int(os.getenv("MAX_QUEUED_EXTRACTIONS", "16"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "10"))
+ADMISSION_POLL_SECONDS = float(os.getenv("ADMISSION_POLL_SECONDS", "1.0"))
+
+# Client-side Gemini quotas. GEMINI_RPM / GEMINI_TPM apply to every model;
+# GEMINI_QUOTAS overrides them per model as JSON, e.g.
+# {"gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}}.
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "1000"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_QUOTAS = json.loads(os.getenv("GEMINI_QUOTAS", "{}"))
+
+# Retries for the Gemini calls made by each extraction node: exponential backoff
+# with jitter, bounded by an attempt count and an overall per-node deadline.
+# RETRY_POLICIES overrides any of these per node as JSON, e.g.
+# {"extract_line_items_data": {"max_attempts": 4, "deadline_seconds": 90}}.
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_INITIAL_BACKOFF_SECONDS = float(os.getenv("RETRY_INITIAL_BACKOFF_SECONDS", "0.5"))
+RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("RETRY_MAX_BACKOFF_SECONDS", "8.0"))
+RETRY_DEADLINE_SECONDS = float(os.getenv("RETRY_DEADLINE_SECONDS", "60.0"))
+RETRY_POLICIES = json.loads(os.getenv("RETRY_POLICIES", "{}"))
+
+# Deadlines: every extraction gets EXTRACTION_DEADLINE_SECONDS end to end, and
+# each Gemini call times out after GEMINI_CALL_TIMEOUT_SECONDS or whatever is
+# left of that budget, whichever is shorter.
+EXTRACTION_DEADLINE_SECONDS = float(os.getenv("EXTRACTION_DEADLINE_SECONDS", "120"))
+GEMINI_CALL_TIMEOUT_SECONDS = float(os.getenv("GEMINI_CALL_TIMEOUT_SECONDS", "60"))
+
+# Request hedging for the chains listed in HEDGE_NODES (comma-separated, e.g.
+# "extract_line_items_data"): once a call has run longer than the
+# HEDGE_PERCENTILE of its last HEDGE_WINDOW latencies, a duplicate is fired and
+# the first to finish wins. No hedging until HEDGE_MIN_SAMPLES calls are seen.
+HEDGE_NODES = [node.strip() for node in os.getenv("HEDGE_NODES", "").split(",") if node.strip()]
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+
+# Tall stitched images are OCR'd as overlapping page-sized tiles in parallel:
+# tiles are OCR_TILE_ASPECT times the image width tall and overlap by
+# OCR_TILE_OVERLAP of a tile.
+OCR_TILING = os.getenv("OCR_TILING", "true").lower() in ("1", "true", "yes")
+OCR_TILE_ASPECT = float(os.getenv("OCR_TILE_ASPECT", "1.414"))
+OCR_TILE_OVERLAP = float(os.getenv("OCR_TILE_OVERLAP", "0.08"))
+
+# Images are preprocessed before vision calls: capped at IMAGE_MAX_DIMENSION
+# pixels on the long side (images taller than OCR_TILE_ASPECT are capped at the
+# matching page width instead), optionally converted to grayscale, and
+# re-encoded as IMAGE_FORMAT ("jpeg" or "webp") at IMAGE_QUALITY.
+IMAGE_PREPROCESSING = os.getenv("IMAGE_PREPROCESSING", "true").lower() in ("1", "true", "yes")
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg").lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+
+# How often RSS is sampled while an extraction runs, for the per-request peak.
+RSS_SAMPLE_SECONDS = float(os.getenv("RSS_SAMPLE_SECONDS", "0.1"))
+
+# Uploads: bodies over MAX_UPLOAD_BYTES are rejected with a 413 while streaming,
+# and file parts over UPLOAD_SPOOL_MAX_BYTES are spooled to disk and memory-mapped.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(1024 * 1024)))
+
+# Batch extraction: documents from /api/extract-invoices run on a pool of
+# BATCH_CONCURRENCY workers, each document taking an admission slot; the whole
+# multipart body is capped at MAX_BATCH_UPLOAD_BYTES.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+
+# Background jobs: state and buffered events live in a SQLite file and are
+# deleted JOB_MAX_AGE_SECONDS after the job was created. The default file sits
+# in backend/, whatever directory the server is started from.
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs.db"))
+JOB_MAX_AGE_SECONDS = int(os.getenv("JOB_MAX_AGE_SECONDS", str(24 * 3600)))
+
+# Graph checkpointing: when set, runs with a thread id (every background job)
+# are checkpointed to this SQLite file and can be resumed after a failure.
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH")
+
+# Response cache for the prompt-based chains (layout analysis and extractors),
+# with the same in-memory LRU + optional SQLite tiers as the OCR cache.
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH")
+LLM_CACHE_MAX_AGE_SECONDS = int(os.getenv("LLM_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
@@ -0,0 +1,147 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Awaitable, Callable, Optional, TypeVar
+import numpy as np
+from . import config, metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# --- Hedged Requests ---
+# For nodes with a long latency tail, a duplicate call is fired once the
+# primary has been running longer than a recent latency percentile, and the
+# first of the two to succeed wins. Only the slow tail pays for a second call.
+# The timer covers the model call alone: the caller acquires rate-limit budget
+# for the primary before hedging starts, and the duplicate acquires its own.
+
+class LatencyTracker:
+    """
+    Rolling window of call latencies for one chain. Async primaries that lose to
+    their hedge are cancelled, so they are recorded at their elapsed time then.
+    """
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int) -> Optional[float]:
+        """The q-th percentile of recent latencies, or None until `min_samples` calls have been seen."""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            samples = list(self._samples)
+        return float(np.percentile(samples, q))
+
+    def hedge_delay(self) -> Optional[float]:
+        """How long to wait for the primary call before hedging, per HEDGE_PERCENTILE."""
+        return self.percentile(config.HEDGE_PERCENTILE, config.HEDGE_MIN_SAMPLES)
+
+# Sync hedged calls run here so the caller can wait on both at once. The losing
+# call cannot be interrupted and finishes in the background.
+_pool = ThreadPoolExecutor(thread_name_prefix="gemini-hedge")
+
+def _record_hedge(name: str, delay: float) -> None:
+    metrics.increment("hedges_fired")
+    logger.info(f"{name}: no response after {delay:.2f}s, firing hedge request")
+
+def hedged_call(name: str, call: Callable[[], T], latency: LatencyTracker, acquire: Callable[[], None]) -> T:
+    """
+    Runs `call`, firing a duplicate if it is slower than the hedge threshold;
+    returns the first success. `acquire` is run before the duplicate to take
+    rate-limit budget for it.
+    """
+    metrics.increment("hedge_eligible_calls")
+    delay = latency.hedge_delay()
+    if delay is None:
+        return call()
+
+    primary = _pool.submit(call)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeout:
+        pass
+
+    _record_hedge(name, delay)
+
+    def duplicate() -> T:
+        acquire()
+        return call()
+
+    hedge = _pool.submit(duplicate)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    metrics.increment("hedge_wins")
+                for loser in pending:
+                    loser.cancel()
+                return future.result()
+    # Both calls failed; surface the primary's error
+    return primary.result()
+
+async def ahedged_call(
+    name: str, call: Callable[[], Awaitable[T]], latency: LatencyTracker, acquire: Callable[[], Awaitable[None]]
+) -> T:
+    """Async version of `hedged_call`; the losing call is cancelled."""
+    metrics.increment("hedge_eligible_calls")
+    delay = latency.hedge_delay()
+    if delay is None:
+        return await call()
+
+    started = time.monotonic()
+    primary = asyncio.ensure_future(call())
+    tasks = [primary]
+    try:
+        try:
+            return await asyncio.wait_for(asyncio.shield(primary), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+        _record_hedge(name, delay)
+
+        async def duplicate() -> T:
+            await acquire()
+            return await call()
+
+        hedge = asyncio.ensure_future(duplicate())
+        tasks.append(hedge)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        metrics.increment("hedge_wins")
+                        if not primary.done():
+                            # The primary is cancelled below and never records its latency. It took at
+                            # least this long; leaving it out would drop the tail from the window and
+                            # drag the hedge threshold down.
+                            latency.record(time.monotonic() - started)
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+def hedge_rates():
+    """Share of eligible calls that fired a hedge, and share of hedges that beat the primary."""
+    eligible = metrics.get("hedge_eligible_calls")
+    fired = metrics.get("hedges_fired")
+    return {
+        "hedge_rate": round(fired / eligible, 3) if eligible else 0.0,
+        "win_rate": round(metrics.get("hedge_wins") / fired, 3) if fired else 0.0,
+    }
+
+metrics.register_gauge("hedging", hedge_rates)
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Background Extraction Jobs ---
+# A job runs an extraction in the background, independent of any connection.
+# Every event it produces is appended to a SQLite store under a sequence
+# number, so clients can poll the job, re-attach to its event stream from any
+# offset after a dropped connection, or fetch the final result once it is done.
+
+FINISHED_STATUSES = ("completed", "failed", "interrupted")
+# Finished jobs that can be resumed from their checkpoints
+RESUMABLE_STATUSES = ("failed", "interrupted")
+
+
+class JobStore:
+    """
+    SQLite-backed record of jobs and their events. Jobs older than
+    `max_age_seconds` are deleted, and `on_expire` is called with each expired
+    job id so that state kept elsewhere (e.g. its checkpoints) goes with it.
+    """
+
+    def __init__(self, path: str, max_age_seconds: float, on_expire: Optional[Callable[[str], None]] = None):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.on_expire = on_expire
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, pipeline TEXT NOT NULL, status TEXT NOT NULL, "
+            "result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created)")
+        self._conn.commit()
+
+    def create(self, pipeline: str) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._conn.execute(
+                "INSERT INTO jobs (id, pipeline, status, created, updated) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, pipeline, now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def reopen(self, job_id: str) -> Optional[int]:
+        """
+        Puts a failed or interrupted job back in the queue to be resumed and
+        returns its number of events so far. Returns None, changing nothing,
+        if the job is in any other state, e.g. because another resume got there first.
+        """
+        placeholders = ", ".join("?" for _ in RESUMABLE_STATUSES)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = 'queued', result = NULL, error = NULL, updated = ? "
+                f"WHERE id = ? AND status IN ({placeholders})",
+                (time.time(), job_id, *RESUMABLE_STATUSES),
+            )
+            self._conn.commit()
+            if cursor.rowcount == 0:
+                return None
+            return self._conn.execute("SELECT COUNT(*) FROM events WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pipeline, status, result, error, created, updated, "
+                "(SELECT COUNT(*) FROM events WHERE job_id = jobs.id) FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        pipeline, status, result, error, created, updated, event_count = row
+        return {
+            "job_id": job_id,
+            "pipeline": pipeline,
+            "status": status,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "created": created,
+            "updated": updated,
+            "event_count": event_count,
+        }
+
+    def append_event(self, job_id: str, seq: int, event: Dict[str, Any], status: Optional[str] = None) -> None:
+        """Records the job's `seq`-th event, updating its status when given."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO events (job_id, seq, event) VALUES (?, ?, ?)", (job_id, seq, json.dumps(event))
+            )
+            if status is not None:
+                self._conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?", (status, now, job_id))
+            self._conn.commit()
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def events(self, job_id: str, offset: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """The job's events from sequence number `offset` on."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM events WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, offset)
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def interrupt_unfinished(self) -> int:
+        """Marks jobs left queued or running by a previous process as interrupted."""
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = 'interrupted', error = 'The server restarted before the job finished.', "
+                f"updated = ? WHERE status NOT IN ({placeholders})",
+                (time.time(), *FINISHED_STATUSES),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.max_age_seconds
+        expired = [job_id for (job_id,) in self._conn.execute("SELECT id FROM jobs WHERE created < ?", (cutoff,))]
+        if not expired:
+            return
+        self._conn.execute("DELETE FROM events WHERE job_id IN (SELECT id FROM jobs WHERE created < ?)", (cutoff,))
+        self._conn.execute("DELETE FROM jobs WHERE created < ?", (cutoff,))
+        if self.on_expire is not None:
+            for job_id in expired:
+                try:
+                    self.on_expire(job_id)
+                except Exception:
+                    logger.exception(f"Cleaning up expired job {job_id} failed")
+
+
+class JobManager:
+    """
+    Runs jobs as event-loop tasks and lets any number of clients follow them.
+    Only used from the event loop, so no locking is needed; store access runs
+    in worker threads.
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        interrupted = store.interrupt_unfinished()
+        if interrupted:
+            logger.warning(f"Marked {interrupted} unfinished job(s) from a previous run as interrupted")
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    async def create(self, pipeline: str) -> str:
+        return await asyncio.to_thread(self.store.create, pipeline)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def start(self, job_id: str, events: AsyncIterator[Dict[str, Any]], first_seq: int = 0) -> None:
+        """Runs the job driven by `events` in the background, numbering its events from `first_seq`."""
+        if job_id in self._tasks:
+            raise ValueError(f"Job {job_id} is already running")
+        self._changed[job_id] = asyncio.Event()
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, events, first_seq))
+        metrics.increment("jobs_started")
+
+    async def resume(self, job_id: str, events: AsyncIterator[Dict[str, Any]]) -> bool:
+        """
+        Reopens a failed or interrupted job and runs it again driven by
+        `events`, continuing its event numbering. Returns False, starting
+        nothing, if the job is not resumable; the status check and the reopen
+        are one conditional update, so of concurrent resumes only one wins.
+        """
+        if job_id in self._tasks:
+            return False
+        first_seq = await asyncio.to_thread(self.store.reopen, job_id)
+        if first_seq is None:
+            return False
+        self.start(job_id, events, first_seq)
+        return True
+
+    def _notify(self, job_id: str) -> None:
+        changed = self._changed.get(job_id)
+        if changed is not None:
+            self._changed[job_id] = asyncio.Event()
+            changed.set()
+
+    async def _run(self, job_id: str, events: AsyncIterator[Dict[str, Any]], first_seq: int) -> None:
+        seq, status, result, error = first_seq, "queued", None, None
+        try:
+            async for event in events:
+                if "error" in event:
+                    status, error = "failed", event["error"]
+                elif "queued" not in event:
+                    status = "running"
+                if "aggregate_results" in event:
+                    result = event["aggregate_results"].get("extracted_data")
+                await asyncio.to_thread(self.store.append_event, job_id, seq, event, status)
+                seq += 1
+                self._notify(job_id)
+            if status != "failed":
+                status = "completed"
+        except asyncio.CancelledError:
+            status, error = "interrupted", "The job was cancelled before it finished."
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            status, error = "failed", str(e)
+        finally:
+            metrics.increment(f"jobs_{status}")
+            # Written synchronously so that the outcome is recorded even while the task is being cancelled
+            self.store.finish(job_id, status, result, error)
+            del self._tasks[job_id]
+            self._notify(job_id)
+            del self._changed[job_id]
+            logger.info(f"Job {job_id} finished with status {status}")
+
+    async def follow(self, job_id: str, offset: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Yields `(seq, event)` for the job's events from `offset` on, then waits
+        for new ones until the job finishes. Leaving does not affect the job.
+        """
+        while True:
+            # Taken before reading, so that an event stored in between still wakes us
+            changed = self._changed.get(job_id)
+            for seq, event in await asyncio.to_thread(self.store.events, job_id, offset):
+                yield seq, event
+                offset = seq + 1
+            if changed is None:
+                return
+            await changed.wait()
+
+    async def shutdown(self) -> None:
+        """Cancels running jobs, recording them as interrupted."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,137 @@
+import re
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from .tokens import TokenStore, group_lines
+
+logger = logging.getLogger(__name__)
+
+# --- Heuristic Layout Analysis ---
+# A geometric stand-in for the `decide_aoi` LLM call: rows are clustered by y,
+# the line-item table is found from its column header row and numeric column
+# alignment, and keyword anchors locate the header and summary blocks.
+
+TABLE_HEADER_KEYWORDS = {
+    "qty", "quantity", "description", "item", "items", "unit", "price", "rate",
+    "amount", "hours", "hrs", "cost", "total",
+}
+SUMMARY_KEYWORDS = ("subtotal", "sub-total", "sub total", "total", "tax", "vat", "gst", "balance", "amount due", "discount")
+HEADER_KEYWORDS = ("invoice", "bill to", "billed to", "ship to", "date", "due", "vendor")
+
+def _keyword_pattern(keywords) -> re.Pattern:
+    """Matches any of the keywords as whole words, so "tax" does not match "taxi"."""
+    return re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")\b")
+
+SUMMARY_PATTERN = _keyword_pattern(SUMMARY_KEYWORDS)
+HEADER_PATTERN = _keyword_pattern(HEADER_KEYWORDS)
+
+NUMBER_PATTERN = re.compile(r"^[\$€£₹]?\(?-?\d[\d,]*(\.\d+)?\)?%?$")
+
+# Horizontal slack, in multiples of the table header's token height, when matching column edges.
+COLUMN_TOLERANCE = 1.5
+
+# Item rows needed for the column alignment to count in full towards the confidence.
+MIN_ITEM_ROWS = 3
+
+def _bbox(tokens: TokenStore, indices: List[int]) -> Optional[Dict[str, int]]:
+    """Smallest box containing the given tokens."""
+    if not indices:
+        return None
+    return {
+        "x1": int(tokens.left[indices].min()),
+        "y1": int(tokens.top[indices].min()),
+        "x2": int(tokens.right[indices].max()),
+        "y2": int(tokens.bottom[indices].max()),
+    }
+
+def _line_text(texts: List[str], line: List[int]) -> str:
+    return " ".join(texts[i] for i in line).lower()
+
+def _is_table_header(texts: List[str], line: List[int]) -> bool:
+    words = {re.sub(r"[^a-z]", "", texts[i].lower()) for i in line}
+    return len(words & TABLE_HEADER_KEYWORDS) >= 2
+
+def _numbers_aligned(tokens: TokenStore, texts: List[str], header: List[int], row: List[int]) -> Tuple[int, bool]:
+    """
+    Number of numeric tokens in `row`, and whether all of them line up with a
+    header column, by right edge (numbers are usually right-aligned) or left edge.
+    """
+    tolerance = COLUMN_TOLERANCE * float(tokens.height[header].mean())
+    header_lefts = tokens.left[header].tolist()
+    header_rights = tokens.right[header].tolist()
+    numbers = [i for i in row if NUMBER_PATTERN.match(texts[i])]
+    aligned = all(
+        any(abs(int(tokens.right[i]) - r) <= tolerance or abs(int(tokens.left[i]) - l) <= tolerance
+            for l, r in zip(header_lefts, header_rights))
+        for i in numbers
+    )
+    return len(numbers), aligned
+
+def _is_item_row(tokens: TokenStore, texts: List[str], header: List[int], row: List[int]) -> bool:
+    """A row with several numbers in the table's columns, e.g. quantity, price and amount."""
+    count, aligned = _numbers_aligned(tokens, texts, header, row)
+    return count >= 2 and aligned
+
+def _is_summary_anchor(texts: List[str], line: List[int]) -> bool:
+    return SUMMARY_PATTERN.search(_line_text(texts, line)) is not None
+
+def _column_alignment(tokens: TokenStore, texts: List[str], header: List[int], rows: List[List[int]]) -> float:
+    """Fraction of table rows whose numeric tokens all line up with a header column."""
+    if not rows:
+        return 0.0
+    aligned = 0
+    for row in rows:
+        count, all_aligned = _numbers_aligned(tokens, texts, header, row)
+        if count and all_aligned:
+            aligned += 1
+    return aligned / len(rows)
+
+def analyze_layout(tokens: TokenStore) -> Tuple[Dict[str, Any], float]:
+    """
+    Locates the header, line-item and summary areas from token geometry alone.
+    Returns the areas in the `AreasOfInterest` shape and a confidence in [0, 1].
+    """
+    empty = {"header_area": None, "line_items_area": None, "summary_area": None}
+    lines = group_lines(tokens)
+    if not lines:
+        return empty, 0.0
+    texts = tokens.texts()
+
+    table_start = next((n for n, line in enumerate(lines) if _is_table_header(texts, line)), None)
+    if table_start is None:
+        return empty, 0.0
+
+    # The summary starts at the first row below the table header that carries a
+    # total/tax anchor, unless the row is shaped like a line item (an item
+    # described as "Tax preparation" is still an item).
+    header = lines[table_start]
+    summary_start = next(
+        (n for n in range(table_start + 1, len(lines))
+         if _is_summary_anchor(texts, lines[n]) and not _is_item_row(tokens, texts, header, lines[n])),
+        None,
+    )
+    table_end = summary_start if summary_start is not None else len(lines)
+    item_rows = lines[table_start + 1:table_end]
+
+    summary_rows = []
+    if summary_start is not None:
+        last_anchor = max(n for n in range(summary_start, len(lines)) if _is_summary_anchor(texts, lines[n]))
+        summary_rows = lines[summary_start:last_anchor + 1]
+
+    header_rows = lines[:table_start]
+    has_header_anchor = any(HEADER_PATTERN.search(_line_text(texts, line)) for line in header_rows)
+    alignment = _column_alignment(tokens, texts, header, item_rows)
+
+    areas = {
+        "header_area": _bbox(tokens, [i for line in header_rows for i in line]),
+        "line_items_area": _bbox(tokens, [i for line in lines[table_start:table_end] for i in line]),
+        "summary_area": _bbox(tokens, [i for line in summary_rows for i in line]),
+    }
+    confidence = (
+        0.35
+        + (0.25 if summary_rows else 0.0)
+        + (0.15 if has_header_anchor else 0.0)
+        # Alignment over one or two rows is weak evidence that the table was found
+        + 0.25 * alignment * min(1.0, len(item_rows) / MIN_ITEM_ROWS)
+    )
+    logger.debug(f"Heuristic layout: {len(item_rows)} item rows, alignment {alignment:.2f}, confidence {confidence:.2f}")
+    return areas, round(confidence, 3)
@@ -0,0 +1,214 @@
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+from langchain_google_genai import ChatGoogleGenerativeAI
+from . import config, metrics
+from .cache import build_cache
+from .ratelimit import get_rate_limiter
+from .retry import call_timeout
+from .hedge import LatencyTracker, hedged_call, ahedged_call
+
+logger = logging.getLogger(__name__)
+
+# --- Shared Gemini Client Registry ---
+# A single chat model per process keeps one underlying HTTP client (and its
+# connection pool) alive across requests, and each structured chain is built
+# once so schema conversion is not repeated on every invoice.
+
+# Gemini bills an image as a fixed number of input tokens.
+IMAGE_TOKEN_ESTIMATE = 258
+
+def estimate_tokens(prompt_text: str, images: int = 0) -> int:
+    """Rough input-token estimate (about four characters per token) used for rate limiting."""
+    return len(prompt_text) // 4 + images * IMAGE_TOKEN_ESTIMATE
+
+# --- Structured Response Cache ---
+# Prompt-based chains (layout analysis and the extractors) are pure functions
+# of their text inputs, so their parsed responses are cached. The key covers
+# everything that could change the answer: chain name, prompt template,
+# output schema, model and the exact prompt inputs.
+
+response_cache = build_cache(
+    config.LLM_CACHE_SIZE,
+    config.LLM_CACHE_DB_PATH,
+    config.LLM_CACHE_MAX_AGE_SECONDS,
+    config.LLM_CACHE_MAX_BYTES,
+)
+
+def _fingerprint(value: Any) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+def _schema_fingerprint(schema: Any) -> str:
+    schema_json = schema if isinstance(schema, dict) else schema.model_json_schema()
+    return _fingerprint(json.dumps(schema_json, sort_keys=True))
+
+class StructuredChain:
+    """
+    A registered structured-output chain. Every call first acquires the
+    shared per-model rate limiter, so callers wait for budget instead of
+    failing with 429s. Chains named in HEDGE_NODES hedge slow calls, and
+    prompt-based chains answer repeated inputs from `response_cache`.
+    """
+
+    def __init__(self, name: str, schema: Any, runnable: Runnable, prompt: Optional[ChatPromptTemplate] = None):
+        self.name = name
+        self.schema = schema
+        self.runnable = runnable
+        self.prompt = prompt
+        self.hedged = name in config.HEDGE_NODES
+        self.latency = LatencyTracker(config.HEDGE_WINDOW)
+        # Only prompt chains with a Pydantic schema are cached; image inputs are cached upstream (OCR)
+        self.cacheable = prompt is not None and not isinstance(schema, dict)
+        if self.cacheable:
+            self._cache_namespace = _fingerprint(":".join([
+                name,
+                config.GEMINI_MODEL_NAME,
+                _fingerprint(repr(prompt.messages)),
+                _schema_fingerprint(schema),
+            ]))
+
+    def _cache_key(self, inputs: Dict[str, Any]) -> str:
+        return f"llm:{self.name}:{self._cache_namespace}:{_fingerprint(json.dumps(inputs, sort_keys=True))}"
+
+    def _cached(self, inputs: Any) -> Optional[Any]:
+        if not self.cacheable:
+            return None
+        cached = response_cache.get(self._cache_key(inputs))
+        if cached is None:
+            metrics.increment("llm_cache_misses")
+            return None
+        metrics.increment("llm_cache_hits")
+        logger.info(f"{self.name}: response cache hit, skipping Gemini call")
+        return self.schema.model_validate_json(cached)
+
+    def _store(self, inputs: Any, result: Any) -> None:
+        if self.cacheable and result is not None:
+            response_cache.set(self._cache_key(inputs), result.model_dump_json())
+
+    def _estimate_tokens(self, inputs: Any) -> int:
+        if self.prompt is not None:
+            return estimate_tokens(self.prompt.format(**inputs))
+        # A list of messages, possibly with image parts
+        text, images = "", 0
+        for message in inputs:
+            parts = message.content if isinstance(message.content, list) else [message.content]
+            for part in parts:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    images += 1
+                else:
+                    text += part.get("text", "") if isinstance(part, dict) else str(part)
+        return estimate_tokens(text, images)
+
+    def _messages(self, inputs: Any) -> Any:
+        return self.prompt.format_messages(**inputs) if self.prompt is not None else inputs
+
+    @staticmethod
+    def _options(timeout: Optional[float]) -> Dict[str, Any]:
+        # The first step of the structured runnable is the model binding, which
+        # passes call-time options such as `timeout` on to the Gemini request
+        return {"timeout": timeout} if timeout is not None else {}
+
+    def _call(self, messages: Any, timeout: Optional[float]) -> Any:
+        """One model call, timed for the hedge threshold; budget must already be acquired."""
+        started = time.monotonic()
+        result = self.runnable.invoke(messages, **self._options(timeout))
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    async def _acall(self, messages: Any, timeout: Optional[float]) -> Any:
+        started = time.monotonic()
+        result = await self.runnable.ainvoke(messages, **self._options(timeout))
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    def _timeout_after_wait(self, timeout: Optional[float], deadline: Optional[float]) -> Optional[float]:
+        """`timeout` shortened to what the rate-limit wait has left of `deadline`."""
+        if deadline is None:
+            return timeout
+        remaining = call_timeout(self.name, deadline)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def _invoke(self, inputs: Any, timeout: Optional[float], deadline: Optional[float]) -> Any:
+        limiter, tokens = get_rate_limiter(config.GEMINI_MODEL_NAME), self._estimate_tokens(inputs)
+        limiter.acquire(tokens, deadline)
+        timeout = self._timeout_after_wait(timeout, deadline)
+        messages = self._messages(inputs)
+        if self.hedged:
+            return hedged_call(self.name, lambda: self._call(messages, timeout), self.latency,
+                               lambda: limiter.acquire(tokens, deadline))
+        return self._call(messages, timeout)
+
+    async def _ainvoke(self, inputs: Any, timeout: Optional[float], deadline: Optional[float]) -> Any:
+        limiter, tokens = get_rate_limiter(config.GEMINI_MODEL_NAME), self._estimate_tokens(inputs)
+        await limiter.aacquire(tokens, deadline)
+        timeout = self._timeout_after_wait(timeout, deadline)
+        messages = self._messages(inputs)
+        if self.hedged:
+            return await ahedged_call(self.name, lambda: self._acall(messages, timeout), self.latency,
+                                      lambda: limiter.aacquire(tokens, deadline))
+        return await self._acall(messages, timeout)
+
+    def invoke(self, inputs: Any, timeout: Optional[float] = None, deadline: Optional[float] = None) -> Any:
+        """
+        Calls the model. `timeout` is passed to the Gemini request itself, so
+        the HTTP call is aborted when it runs out instead of being left running
+        in the background. With a `deadline` (a `time.time()` timestamp), the
+        rate-limit wait may not run past it, and `timeout` is shortened to
+        whatever the wait has left.
+        """
+        result = self._cached(inputs)
+        if result is not None:
+            return result
+        result = self._invoke(inputs, timeout, deadline)
+        self._store(inputs, result)
+        return result
+
+    async def ainvoke(self, inputs: Any, timeout: Optional[float] = None, deadline: Optional[float] = None) -> Any:
+        """Async version of `invoke`; cache keys and lookups run in a worker thread."""
+        if self.cacheable:
+            result = await asyncio.to_thread(self._cached, inputs)
+            if result is not None:
+                return result
+        result = await self._ainvoke(inputs, timeout, deadline)
+        if self.cacheable:
+            await asyncio.to_thread(self._store, inputs, result)
+        return result
+
+_lock = threading.Lock()
+_llm: Optional[ChatGoogleGenerativeAI] = None
+_chains: Dict[str, StructuredChain] = {}
+
+def get_llm() -> ChatGoogleGenerativeAI:
+    """Returns the process-wide Gemini chat model, creating it on first use."""
+    global _llm
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                logger.info(f"Creating shared Gemini client for {config.GEMINI_MODEL_NAME}")
+                # Retries are owned by each node's RetryPolicy (see retry.py), so the
+                # SDK makes a single attempt per call.
+                _llm = ChatGoogleGenerativeAI(model=config.GEMINI_MODEL_NAME, temperature=0, max_retries=1)
+    return _llm
+
+def get_structured_chain(name: str, schema: Any, prompt: Optional[ChatPromptTemplate] = None) -> StructuredChain:
+    """
+    Returns the cached structured-output chain registered under `name`.
+    The chain formats `prompt` (when given) and calls
+    `llm.with_structured_output(schema)` on the result; the prompt is applied
+    separately so call-time options reach the model. Safe to call from any thread.
+    """
+    chain = _chains.get(name)
+    if chain is None:
+        llm = get_llm()
+        with _lock:
+            chain = _chains.get(name)
+            if chain is None:
+                chain = StructuredChain(name, schema, llm.with_structured_output(schema), prompt)
+                _chains[name] = chain
+    return chain
@@ -1,14 +1,24 @@
 import json
 import os
-import asyncio
+import time
 import logging
-from fastapi import FastAPI, UploadFile, File
+from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTasks
 
-from . import config
+from . import config, metrics
 from .schema import CompleteInvoice
-from .agent import run_agent, run_agent_stream
+from .agent import run_agent, run_agent_astream, resume_agent_astream, checkpointer, PIPELINES
+from .streaming import stream_until_disconnected
+from .memory import track_peak_rss
+from .admission import AdmissionController, QueueFull, Ticket
+from .uploads import UploadLimitMiddleware, read_upload, content_digest
+from .singleflight import SingleFlight
+from .batch import arun_agent_batch, iter_archive
+from .jobs import JobManager, JobStore, FINISHED_STATUSES, RESUMABLE_STATUSES
 
 # Configure logging
 logging.basicConfig(
@@ -17,8 +27,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Background jobs outlive the request that created them. A failed job keeps its
+# checkpoints for resuming until the job itself expires. The job store is opened
+# when the server starts rather than on import, since opening it marks the jobs
+# a previous process left unfinished as interrupted.
+jobs: Optional[JobManager] = None
+metrics.register_gauge("jobs_running", lambda: jobs.running if jobs is not None else 0)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global jobs
+    jobs = JobManager(JobStore(
+        config.JOB_DB_PATH,
+        config.JOB_MAX_AGE_SECONDS,
+        on_expire=checkpointer.delete_thread if checkpointer is not None else None,
+    ))
+    yield
+    await jobs.shutdown()
+
 # Create the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Bound concurrent extractions so bursts queue up instead of exhausting memory and rate limits
+admission = AdmissionController(config.MAX_CONCURRENT_EXTRACTIONS, config.MAX_QUEUED_EXTRACTIONS)
+metrics.register_gauge("extractions_active", lambda: admission.active)
+metrics.register_gauge("extractions_queued", lambda: admission.queued)
+
+# Identical uploads extracted concurrently share one run
+flights = SingleFlight()
+metrics.register_gauge("extractions_in_flight", lambda: flights.active)
+
+# Reject oversized uploads while they stream in (registered before CORS so the 413 still carries CORS headers)
+app.add_middleware(UploadLimitMiddleware, paths=["/api/extract-invoice", "/api/jobs"], max_bytes=config.MAX_UPLOAD_BYTES)
+app.add_middleware(UploadLimitMiddleware, paths=["/api/extract-invoices"], max_bytes=config.MAX_BATCH_UPLOAD_BYTES)
 
 # Configure CORS
 app.add_middleware(
@@ -36,32 +77,226 @@ async def get_invoice_schema():
     """
     return CompleteInvoice.model_json_schema()
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """
+    This endpoint reports process-wide counters and gauges.
+    """
+    return metrics.snapshot()
+
+def _check_pipeline(pipeline: str) -> None:
+    if pipeline not in PIPELINES:
+        raise HTTPException(status_code=400, detail=f"Unknown pipeline '{pipeline}'. Expected one of: {', '.join(PIPELINES)}.")
+
+def _too_busy() -> JSONResponse:
+    """The response to a request turned away because the admission queue is full."""
+    metrics.increment("extractions_rejected")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many extractions in progress. Please retry later."},
+        headers={"Retry-After": str(config.ADMISSION_RETRY_AFTER_SECONDS)},
+    )
+
+def _job_not_found(job_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"detail": f"Unknown job '{job_id}'."})
+
+def _job_not_resumable(job: Dict[str, Any]) -> JSONResponse:
+    return JSONResponse(status_code=409, content={"detail": f"Job is {job['status']}.", "status": job["status"]})
+
 @app.post("/api/extract-invoice")
-async def extract_invoice_data(file: UploadFile = File(...)):
+async def extract_invoice_data(request: Request, file: UploadFile = File(...), pipeline: str = Form("standard")):
     """
     This endpoint receives an invoice image and streams the extraction progress.
+    `pipeline` selects the multi-stage "standard" graph or the single-call "combined" one.
+    """
+    _check_pipeline(pipeline)
+    # Small uploads are read into memory; larger ones stay spooled on disk and are memory-mapped.
+    contents = await read_upload(file)
+    key = f"{pipeline}:{await content_digest(contents)}"
+
+    # An identical upload already being extracted is joined rather than run again,
+    # without taking another admission slot.
+    subscription = flights.join(key)
+    if subscription is None:
+        try:
+            ticket = admission.enqueue()
+        except QueueFull:
+            return _too_busy()
+        # The slot belongs to the run, not to this client: it is freed when the run ends,
+        # even if the run is cancelled before it starts.
+        subscription = flights.start(key, extraction_events(ticket, contents, pipeline), on_finish=ticket.release)
+    del contents
+
+    async def event_generator():
+        # The extraction runs in its own task and is only cancelled once every client
+        # attached to it has gone.
+        async for event in stream_until_disconnected(request, subscription.events()):
+            yield f"data: {json.dumps(event)}\n\n"
+
+    # Idempotent; the background task covers responses whose generator never started.
+    background = BackgroundTasks()
+    background.add_task(subscription.detach)
+    return StreamingResponse(event_generator(), media_type="text/event-stream", background=background)
+
+async def extraction_events(ticket: Ticket, contents, pipeline: str, thread_id: Optional[str] = None):
+    """
+    The SSE events of one extraction: queue positions until admitted, then the
+    graph's node updates, or an error event. Without `contents`, the
+    checkpointed run on `thread_id` is resumed instead.
+    """
+    try:
+        # Queued clients are told their position until a slot frees up.
+        async for position in ticket.wait(config.ADMISSION_POLL_SECONDS):
+            yield {"queued": {"position": position}}
+        # Hand the upload off so that the graph holds the sole reference and can release it after OCR.
+        if contents is None:
+            stream = resume_agent_astream(thread_id, pipeline)
+        else:
+            stream = run_agent_astream(contents, pipeline, thread_id)
+        del contents
+        # The async graph awaits Gemini directly, so no executor thread is held per request.
+        async for chunk in track_peak_rss(stream):
+            yield chunk
+    except Exception as e:
+        logger.exception("Error during invoice extraction stream")
+        yield {"error": str(e)}
+    finally:
+        ticket.release()
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...), pipeline: str = Form("standard")):
+    """
+    This endpoint starts an extraction in the background and returns its job id
+    immediately. The job keeps running if the client goes away.
     """
-    contents = await file.read()
-    
+    _check_pipeline(pipeline)
+    try:
+        ticket = admission.enqueue()
+    except QueueFull:
+        return _too_busy()
+    try:
+        contents = await read_upload(file)
+        job_id = await jobs.create(pipeline)
+    except Exception:
+        ticket.release()
+        raise
+    # With checkpointing on, the job id doubles as the graph's thread id so that a failed job can be resumed
+    thread_id = job_id if checkpointer is not None else None
+    jobs.start(job_id, extraction_events(ticket, contents, pipeline, thread_id))
+    del contents
+    return {"job_id": job_id, "status": "queued"}
+
+@app.post("/api/jobs/{job_id}/resume", status_code=202)
+async def resume_job(job_id: str):
+    """
+    This endpoint resumes a failed or interrupted job from its last checkpoint,
+    rerunning only the stages that had not completed. Its new events continue
+    the job's event stream.
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    if checkpointer is None:
+        return JSONResponse(status_code=409, content={"detail": "Checkpointing is disabled; set CHECKPOINT_DB_PATH to resume jobs."})
+    if jobs.is_running(job_id) or job["status"] not in RESUMABLE_STATUSES:
+        return _job_not_resumable(job)
+    try:
+        ticket = admission.enqueue()
+    except QueueFull:
+        return _too_busy()
+    # Another resume may have started the job since it was read; only one of them reopens it.
+    if not await jobs.resume(job_id, extraction_events(ticket, None, job["pipeline"], job_id)):
+        ticket.release()
+        job = await jobs.get(job_id)
+        return _job_not_resumable(job) if job is not None else _job_not_found(job_id)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    This endpoint reports a job's status, its number of buffered events and,
+    once it has completed, the extracted invoice.
+    """
+    job = await jobs.get(job_id)
+    return job if job is not None else _job_not_found(job_id)
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    This endpoint returns the job's final `CompleteInvoice` data, or a 409 with
+    the job's status while it has not completed.
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    if job["status"] != "completed":
+        return JSONResponse(
+            status_code=409,
+            content={"detail": f"Job is {job['status']}.", "status": job["status"], "error": job["error"]},
+        )
+    return job["result"]
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, offset: int = 0, last_event_id: Optional[int] = Header(None)):
+    """
+    This endpoint streams a job's events over SSE, starting at event `offset`,
+    and closes with a `job` event carrying its final status. Each event's SSE id
+    is the offset to resume from, so a reconnecting EventSource picks up via
+    `Last-Event-ID` where it left off.
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    if last_event_id is not None:
+        offset = last_event_id
+
     async def event_generator():
-        loop = asyncio.get_event_loop()
-        gen = run_agent_stream(contents)
-        sentinel = object()
-        
-        while True:
-            try:
-                # Use a sentinel to avoid StopIteration exception in run_in_executor
-                chunk = await loop.run_in_executor(None, next, gen, sentinel)
-                if chunk is sentinel:
-                    break
-                yield f"data: {json.dumps(chunk)}\n\n"
-            except Exception as e:
-                logger.exception("Error during invoice extraction stream")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                break
-    
+        # Following a job never cancels it, so a dropped client only stops its own stream
+        async for seq, event in jobs.follow(job_id, offset):
+            yield f"id: {seq + 1}\ndata: {json.dumps(event)}\n\n"
+        job = await jobs.get(job_id)
+        if job is not None and job["status"] in FINISHED_STATUSES:
+            yield f"data: {json.dumps({'job': {'status': job['status'], 'error': job['error']}})}\n\n"
+
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+ARCHIVE_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+def _is_archive(file: UploadFile) -> bool:
+    return file.content_type in ARCHIVE_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+def _batch_documents(uploads):
+    """Flattens the uploaded files into documents, expanding ZIP archives into their members."""
+    for name, contents, archive in uploads:
+        if archive:
+            yield from iter_archive(contents, config.MAX_UPLOAD_BYTES)
+        else:
+            yield name, contents
+
+@app.post("/api/extract-invoices")
+async def extract_invoices_batch(request: Request, files: List[UploadFile] = File(...), pipeline: str = Form("standard")):
+    """
+    This endpoint receives many invoices, as separate files and/or ZIP archives, and
+    streams one NDJSON line per document as it finishes, then a summary line.
+    """
+    _check_pipeline(pipeline)
+    uploads = [(file.filename, await read_upload(file), _is_archive(file)) for file in files]
+
+    async def line_generator():
+        started = time.monotonic()
+        counts = {"completed": 0, "failed": 0}
+        try:
+            results = arun_agent_batch(_batch_documents(uploads), pipeline, config.BATCH_CONCURRENCY, admission)
+            async for result in stream_until_disconnected(request, results):
+                counts[result["status"]] += 1
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            logger.exception("Error during batch extraction")
+            yield json.dumps({"error": str(e)}) + "\n"
+        yield json.dumps({"summary": {**counts, "seconds": round(time.monotonic() - started, 3)}}) + "\n"
+
+    return StreamingResponse(line_generator(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
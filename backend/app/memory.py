@@ -0,0 +1,49 @@
+import os
+import asyncio
+import logging
+import resource
+from typing import AsyncIterator, TypeVar
+from . import config, metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (falls back to the lifetime peak off Linux)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+async def track_peak_rss(stream: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    Yields from `stream` while sampling RSS every RSS_SAMPLE_SECONDS, then
+    records how far the peak rose above the RSS at the start under
+    `request_peak_rss_bytes`. RSS is process-wide, so with concurrent requests
+    the figure includes their growth too.
+    """
+    start = peak = current_rss()
+
+    async def sample():
+        nonlocal peak
+        while True:
+            await asyncio.sleep(config.RSS_SAMPLE_SECONDS)
+            peak = max(peak, current_rss())
+
+    sampler = asyncio.create_task(sample())
+    try:
+        async for item in stream:
+            yield item
+    finally:
+        sampler.cancel()
+        peak = max(peak, current_rss())
+        metrics.observe("request_peak_rss_bytes", peak - start)
+        logger.info(
+            f"Peak RSS during extraction: {peak / (1024 * 1024):.1f} MB "
+            f"({(peak - start) / (1024 * 1024):+.1f} MB over the start)"
+        )
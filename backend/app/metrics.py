@@ -0,0 +1,51 @@
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+# --- Process-wide Metrics ---
+# Counters are incremented from request handlers and executor threads alike;
+# observations keep a count, mean and max per name; gauges are callables
+# sampled when a snapshot is taken.
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_observations: Dict[str, Dict[str, float]] = {}
+_gauges: Dict[str, Callable[[], Any]] = {}
+
+def increment(name: str, amount: float = 1) -> None:
+    """Adds `amount` to the named counter."""
+    with _lock:
+        _counters[name] += amount
+
+def observe(name: str, value: float) -> None:
+    """Records one observation of the named value."""
+    with _lock:
+        summary = _observations.setdefault(name, {"count": 0, "sum": 0.0, "max": value})
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+
+def get(name: str) -> float:
+    """Returns the current value of the named counter."""
+    with _lock:
+        return _counters.get(name, 0.0)
+
+def register_gauge(name: str, sample: Callable[[], Any]) -> None:
+    """Registers a callable whose current value is reported under `name`."""
+    with _lock:
+        _gauges[name] = sample
+
+def snapshot() -> Dict[str, Any]:
+    """Returns the current value of every counter and gauge."""
+    with _lock:
+        values = dict(_counters)
+        for name, summary in _observations.items():
+            values[name] = {
+                "count": summary["count"],
+                "mean": summary["sum"] / summary["count"],
+                "max": summary["max"],
+            }
+        gauges = dict(_gauges)
+    for name, sample in gauges.items():
+        values[name] = sample()
+    return values
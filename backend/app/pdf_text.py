@@ -0,0 +1,65 @@
+import logging
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+import pdfplumber
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# The frontend renders PDF pages with pdf.js at this scale and stacks them
+# vertically, so tokens are mapped into the same pixel frame for highlighting.
+PDF_RENDER_SCALE = 2.0
+
+def is_pdf(content: bytes) -> bool:
+    """Returns True if the upload looks like a PDF document."""
+    return bytes(content[:1024]).lstrip().startswith(b"%PDF-")
+
+def read_pdf_text_layer(pdf_content: bytes, min_chars: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Reads words and their boxes from the embedded text layer of a PDF.
+    Returns `(ocr_data, scanned_pages)`, where `ocr_data` uses the usual
+    `{text, left, top, width, height}` token shape in the stitched page frame and
+    `scanned_pages` lists pages with too little text, rendered to JPEG, along
+    with their vertical offset so they can be sent to vision OCR instead.
+    """
+    ocr_data = []
+    scanned_pages = []
+    with pdfplumber.open(BytesIO(pdf_content)) as pdf:
+        y_offset = 0
+        for page_number, page in enumerate(pdf.pages, start=1):
+            if len(page.chars) >= min_chars:
+                for word in page.extract_words():
+                    left = int(word["x0"] * PDF_RENDER_SCALE)
+                    top = int(word["top"] * PDF_RENDER_SCALE)
+                    ocr_data.append({
+                        "text": word["text"],
+                        "left": left,
+                        "top": y_offset + top,
+                        "width": int(word["x1"] * PDF_RENDER_SCALE) - left,
+                        "height": int(word["bottom"] * PDF_RENDER_SCALE) - top
+                    })
+            else:
+                logger.info(f"PDF page {page_number} has no usable text layer, falling back to vision OCR")
+                image = page.to_image(resolution=72 * PDF_RENDER_SCALE).original.convert("RGB")
+                buffer = BytesIO()
+                image.save(buffer, format="JPEG", quality=90)
+                scanned_pages.append({"image_content": buffer.getvalue(), "top": y_offset})
+            y_offset += int(page.height * PDF_RENDER_SCALE)
+
+    logger.debug(f"PDF text layer tokens: {len(ocr_data)}, scanned pages: {len(scanned_pages)}")
+    return ocr_data, scanned_pages
+
+def render_pdf_pages(pdf_content: bytes) -> bytes:
+    """Renders every page and stacks them vertically into one JPEG, matching the frontend's stitched frame."""
+    with pdfplumber.open(BytesIO(pdf_content)) as pdf:
+        pages = [page.to_image(resolution=72 * PDF_RENDER_SCALE).original.convert("RGB") for page in pdf.pages]
+        heights = [int(page.height * PDF_RENDER_SCALE) for page in pdf.pages]
+
+    stitched = Image.new("RGB", (max(page.width for page in pages), sum(heights)), "white")
+    y_offset = 0
+    for page, page_height in zip(pages, heights):
+        stitched.paste(page, (0, y_offset))
+        y_offset += page_height
+    buffer = BytesIO()
+    stitched.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
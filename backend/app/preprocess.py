@@ -0,0 +1,88 @@
+import logging
+from io import BytesIO
+from PIL import Image
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# --- Vision Input Preprocessing ---
+# Uploads are often multi-megabyte PNGs from the frontend canvas. Before an
+# image is sent to Gemini it is capped at IMAGE_MAX_DIMENSION, converted to
+# grayscale and re-encoded as JPEG or WebP, which shrinks the payload, the
+# request latency and the memory held while the call is in flight.
+#
+# The cap applies to the long side of page-shaped images (and OCR tiles).
+# Images taller than a page, such as stitched multi-page scans, are capped by
+# width instead, at the width a page of that cap would have, so their text is
+# not squashed to an illegible size.
+
+IMAGE_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+class PreparedImage:
+    """
+    An image ready to send to Gemini. `width` / `height` are the original
+    pixel size, and `scale` is the processed size divided by the original,
+    so coordinates on the processed image map back by dividing by `scale`.
+    """
+
+    __slots__ = ("content", "mime_type", "width", "height", "scale")
+
+    def __init__(self, content: bytes, mime_type: str, width: int, height: int, scale: float = 1.0):
+        self.content = content
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.scale = scale
+
+# Enough of the file for PIL to identify any supported format from its header.
+IMAGE_HEADER_BYTES = 1024 * 1024
+
+def is_image(content) -> bool:
+    """Returns True if PIL recognises the upload as an image. Only the header is read."""
+    try:
+        Image.open(BytesIO(bytes(content[:IMAGE_HEADER_BYTES])))
+    except Exception:
+        return False
+    return True
+
+def convert_opaque(image: Image.Image, mode: str) -> Image.Image:
+    """
+    Converts `image` to `mode`, compositing any transparency onto white first.
+    PIL drops the alpha channel on conversion, which leaves transparent pixels
+    in their stored colour, usually black, and blanks out dark text on them.
+    """
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        image = Image.alpha_composite(Image.new("RGBA", image.size, (255, 255, 255, 255)), image)
+    return image.convert(mode)
+
+def _target_scale(width: int, height: int) -> float:
+    if height > width * config.OCR_TILE_ASPECT:
+        return config.IMAGE_MAX_DIMENSION / config.OCR_TILE_ASPECT / width
+    return config.IMAGE_MAX_DIMENSION / max(width, height)
+
+def preprocess_image(image_content: bytes) -> PreparedImage:
+    """Downscales, converts and re-encodes an image per the IMAGE_* settings."""
+    image = Image.open(BytesIO(image_content))
+    width, height = image.size
+    if not config.IMAGE_PREPROCESSING:
+        return PreparedImage(image_content, Image.MIME.get(image.format, "image/jpeg"), width, height)
+
+    scale = min(1.0, _target_scale(width, height))
+    target = (max(1, round(width * scale)), max(1, round(height * scale)))
+    mode = "L" if config.IMAGE_GRAYSCALE else "RGB"
+    # JPEGs can be decoded straight at a reduced size, which skips most of the decoding work
+    image.draft(mode, target)
+    image = convert_opaque(image, mode)
+    if image.size != target:
+        image = image.resize(target, Image.LANCZOS)
+
+    fmt = config.IMAGE_FORMAT if config.IMAGE_FORMAT in IMAGE_MIME_TYPES else "jpeg"
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=config.IMAGE_QUALITY)
+    content = buffer.getvalue()
+    logger.debug(
+        f"Preprocessed {width}x{height} image ({len(image_content)} bytes) "
+        f"to {target[0]}x{target[1]} {fmt} ({len(content)} bytes)"
+    )
+    return PreparedImage(content, IMAGE_MIME_TYPES[fmt], width, height, target[0] / width)
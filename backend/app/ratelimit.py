@@ -0,0 +1,116 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional
+from . import config, metrics
+from .retry import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# --- Client-side Gemini Rate Limiting ---
+# Token buckets per model for requests/min and tokens/min. Callers reserve
+# capacity up front (the balance may go negative) and then sleep until their
+# reservation is covered, so concurrent callers queue fairly instead of
+# racing into 429s.
+
+class TokenBucket:
+    """A token bucket that refills continuously at `capacity` per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self._level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Takes `amount` from the bucket and returns how long to wait until it is covered."""
+        self._refill(now)
+        self._level -= min(amount, self.capacity)
+        return max(0.0, -self._level / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Gives back a reservation that will not be used."""
+        self._level += min(amount, self.capacity)
+
+    def utilisation(self, now: float) -> float:
+        """Share of the per-minute budget currently spoken for (can exceed 1 while callers wait)."""
+        self._refill(now)
+        return round(1 - self._level / self.capacity, 3)
+
+class ModelRateLimiter:
+    """Requests/min and tokens/min limits for one model; safe to share across threads and event loops."""
+
+    def __init__(self, model: str, requests_per_minute: float, tokens_per_minute: float):
+        self.model = model
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+
+    def _reserve(self, estimated_tokens: int, deadline: Optional[float] = None) -> float:
+        with self._lock:
+            now = time.monotonic()
+            delay = max(self._requests.reserve(1, now), self._tokens.reserve(estimated_tokens, now))
+            if deadline is not None and time.time() + delay >= deadline:
+                # The call could not start in time, so its budget goes back to callers that can
+                self._requests.refund(1)
+                self._tokens.refund(estimated_tokens)
+                metrics.increment("rate_limit_deadline_exceeded")
+                raise DeadlineExceeded(f"Rate limit for {self.model}: a {delay:.2f}s wait would pass the extraction deadline")
+        if delay > 0:
+            metrics.increment("rate_limit_waits")
+            metrics.increment("rate_limit_wait_seconds", delay)
+            logger.info(f"Rate limit for {self.model}: waiting {delay:.2f}s")
+        return delay
+
+    def acquire(self, estimated_tokens: int, deadline: Optional[float] = None) -> None:
+        """
+        Blocks the calling thread until the request fits in the budget. Raises
+        `DeadlineExceeded` without waiting if that would take until `deadline`
+        (a `time.time()` timestamp).
+        """
+        delay = self._reserve(estimated_tokens, deadline)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, estimated_tokens: int, deadline: Optional[float] = None) -> None:
+        """Async version of `acquire`."""
+        delay = self._reserve(estimated_tokens, deadline)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def utilisation(self) -> Dict[str, float]:
+        with self._lock:
+            now = time.monotonic()
+            return {"requests": self._requests.utilisation(now), "tokens": self._tokens.utilisation(now)}
+
+_limiters: Dict[str, ModelRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """Returns the process-wide limiter for `model`, using GEMINI_QUOTAS overrides when present."""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(model)
+            if limiter is None:
+                quota = config.GEMINI_QUOTAS.get(model, {})
+                limiter = ModelRateLimiter(
+                    model,
+                    quota.get("rpm", config.GEMINI_RPM),
+                    quota.get("tpm", config.GEMINI_TPM),
+                )
+                _limiters[model] = limiter
+    return limiter
+
+def utilisation() -> Dict[str, Any]:
+    """Budget utilisation for every model that has been called."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.model: limiter.utilisation() for limiter in limiters}
+
+metrics.register_gauge("gemini_rate_limit_utilisation", utilisation)
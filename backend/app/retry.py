@@ -0,0 +1,160 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+from google.genai import errors as genai_errors
+import httpx
+from . import config, metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# --- Per-node Retry Policies ---
+# Each extraction node retries its own Gemini calls, so a transient 5xx or
+# timeout costs one extra call instead of a rerun of the whole invoice.
+
+# Errors worth another attempt. Client errors are only retried for the status
+# codes in RETRYABLE_STATUS_CODES; anything else (bad request, auth, schema
+# validation) fails the same way every time.
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (
+    genai_errors.ServerError,
+    httpx.TransportError,
+    TimeoutError,
+    ConnectionError,
+)
+RETRYABLE_STATUS_CODES = {408, 429}
+
+class DeadlineExceeded(Exception):
+    """Raised when the extraction's deadline budget runs out before a node's call succeeds."""
+
+def call_timeout(node: str, deadline: Optional[float]) -> Optional[float]:
+    """
+    Timeout for the next call: the per-call cap, shortened to what is left of
+    the `deadline` (a `time.time()` timestamp). Raises `DeadlineExceeded` if
+    nothing is left.
+    """
+    if deadline is None:
+        return config.GEMINI_CALL_TIMEOUT_SECONDS
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"{node}: extraction deadline exceeded")
+    return min(config.GEMINI_CALL_TIMEOUT_SECONDS, remaining)
+
+def is_timeout(error: BaseException) -> bool:
+    """True if `error`, or the error it was raised from, is a call timeout or an exhausted deadline."""
+    while error is not None:
+        if isinstance(error, (DeadlineExceeded, TimeoutError, httpx.TimeoutException)):
+            return True
+        error = error.__cause__
+    return False
+
+def is_retryable(error: BaseException) -> bool:
+    """True if `error`, or the error it was raised from, is transient."""
+    while error is not None:
+        if isinstance(error, RETRYABLE_ERRORS):
+            return True
+        if getattr(error, "code", None) in RETRYABLE_STATUS_CODES:
+            return True
+        error = error.__cause__
+    return False
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by an attempt count and an overall deadline."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        initial_backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 8.0,
+        deadline_seconds: float = 60.0,
+        retry_on: Callable[[BaseException], bool] = is_retryable,
+    ):
+        self.max_attempts = max_attempts
+        self.initial_backoff_seconds = initial_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.deadline_seconds = deadline_seconds
+        self.retry_on = retry_on
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to sleep after the given (1-based) failed attempt."""
+        ceiling = min(self.max_backoff_seconds, self.initial_backoff_seconds * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def next_delay(self, error: BaseException, attempt: int, started: float, deadline: Optional[float] = None) -> float:
+        """Returns the delay before the next attempt, or re-raises `error` if it should not be retried."""
+        if deadline is not None and time.time() >= deadline:
+            raise DeadlineExceeded(f"extraction deadline exceeded after {attempt} attempt(s)") from error
+        if attempt >= self.max_attempts or not self.retry_on(error):
+            raise error
+        delay = self.backoff(attempt)
+        if time.monotonic() - started + delay > self.deadline_seconds:
+            raise error
+        if deadline is not None and time.time() + delay >= deadline:
+            raise DeadlineExceeded(f"extraction deadline leaves no time to retry after {attempt} attempt(s)") from error
+        return delay
+
+def _build_policies() -> Dict[str, RetryPolicy]:
+    defaults = {
+        "max_attempts": config.RETRY_MAX_ATTEMPTS,
+        "initial_backoff_seconds": config.RETRY_INITIAL_BACKOFF_SECONDS,
+        "max_backoff_seconds": config.RETRY_MAX_BACKOFF_SECONDS,
+        "deadline_seconds": config.RETRY_DEADLINE_SECONDS,
+    }
+    nodes = (
+        "extract_structured_ocr", "decide_aoi", "extract_header_data",
+        "extract_line_items_data", "extract_summary_data", "extract_complete_invoice",
+    )
+    return {node: RetryPolicy(**{**defaults, **config.RETRY_POLICIES.get(node, {})}) for node in nodes}
+
+RETRY_POLICIES = _build_policies()
+
+def get_retry_policy(node: str) -> RetryPolicy:
+    """Returns the retry policy configured for a node."""
+    return RETRY_POLICIES.get(node) or RetryPolicy()
+
+def _record_failure(node: str, error: BaseException, attempt: int, delay: float) -> None:
+    metrics.increment("llm_retries")
+    logger.warning(f"{node}: attempt {attempt} failed with {type(error).__name__}: {error}; retrying in {delay:.2f}s")
+
+def call_with_retry(
+    node: str, call: Callable[[Optional[float]], T], attempts: Dict[str, int], deadline: Optional[float] = None
+) -> T:
+    """
+    Calls `call(timeout)` under the node's retry policy, with each attempt's
+    timeout taken from the remaining `deadline` budget. Every attempt,
+    successful or not, is counted in `attempts[node]` so it can be reported
+    with the node's state update.
+    """
+    policy = get_retry_policy(node)
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        timeout = call_timeout(node, deadline)
+        attempt += 1
+        attempts[node] = attempts.get(node, 0) + 1
+        try:
+            return call(timeout)
+        except Exception as e:
+            delay = policy.next_delay(e, attempt, started, deadline)
+            _record_failure(node, e, attempt, delay)
+            time.sleep(delay)
+
+async def acall_with_retry(
+    node: str, call: Callable[[Optional[float]], Awaitable[T]], attempts: Dict[str, int], deadline: Optional[float] = None
+) -> T:
+    """Async version of `call_with_retry`."""
+    policy = get_retry_policy(node)
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        timeout = call_timeout(node, deadline)
+        attempt += 1
+        attempts[node] = attempts.get(node, 0) + 1
+        try:
+            return await call(timeout)
+        except Exception as e:
+            delay = policy.next_delay(e, attempt, started, deadline)
+            _record_failure(node, e, attempt, delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,64 @@
+import logging
+from typing import Callable, Dict
+from .tokens import TokenStore, group_lines
+
+logger = logging.getLogger(__name__)
+
+# --- OCR Token Prompt Serializers ---
+# Every format keeps pixel coordinates as (x1, y1, x2, y2) so the node prompts
+# stay valid; the compact formats only drop the repeated labels.
+
+def serialize_verbose(tokens: TokenStore) -> str:
+    """One labelled line per token: `text: '...', x1: .., y1: .., x2: .., y2: ..`."""
+    return "\n".join([
+        f"text: '{text}', x1: {x1}, y1: {y1}, x2: {x2}, y2: {y2}"
+        for text, x1, y1, x2, y2 in zip(tokens.texts(), tokens.left.tolist(), tokens.top.tolist(),
+                                        tokens.right.tolist(), tokens.bottom.tolist())
+    ])
+
+def serialize_table(tokens: TokenStore) -> str:
+    """CSV-like rows `x1,y1,x2,y2,text`; text comes last so it never needs quoting."""
+    rows = [
+        f"{x1},{y1},{x2},{y2},{text}"
+        for text, x1, y1, x2, y2 in zip(tokens.texts(), tokens.left.tolist(), tokens.top.tolist(),
+                                        tokens.right.tolist(), tokens.bottom.tolist())
+    ]
+    return "\n".join(["x1,y1,x2,y2,text"] + rows)
+
+def serialize_lines(tokens: TokenStore) -> str:
+    """
+    Groups tokens sharing a baseline into one line with a single y-range:
+    `y1-y2: x1-x2 text | x1-x2 text`.
+    """
+    lines = group_lines(tokens)
+    if not lines:
+        return ""
+    texts = tokens.texts()
+    left, top = tokens.left.tolist(), tokens.top.tolist()
+    right, bottom = tokens.right.tolist(), tokens.bottom.tolist()
+
+    rendered = ["y1-y2: x1-x2 text | x1-x2 text | ..."]
+    for line in lines:
+        y1 = min(top[i] for i in line)
+        y2 = max(bottom[i] for i in line)
+        rendered.append(f"{y1}-{y2}: " + " | ".join(f"{left[i]}-{right[i]} {texts[i]}" for i in line))
+    return "\n".join(rendered)
+
+TOKEN_SERIALIZERS: Dict[str, Callable[[TokenStore], str]] = {
+    "verbose": serialize_verbose,
+    "table": serialize_table,
+    "lines": serialize_lines,
+}
+
+def serialize_tokens(tokens: TokenStore, fmt: str = "verbose", label: str = "prompt") -> str:
+    """Serializes tokens with the named format and logs its size against the verbose baseline."""
+    serializer = TOKEN_SERIALIZERS.get(fmt)
+    if serializer is None:
+        logger.warning(f"Unknown token format '{fmt}', falling back to 'verbose'")
+        fmt, serializer = "verbose", serialize_verbose
+    text = serializer(tokens)
+    if fmt != "verbose":
+        baseline = len(serialize_verbose(tokens))
+        saved = 100 * (1 - len(text) / baseline) if baseline else 0
+        logger.info(f"{label} tokens as '{fmt}': {len(text)} chars (verbose: {baseline}, {saved:.0f}% smaller)")
+    return text
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- In-flight Request Coalescing ---
+# Identical uploads that arrive while an extraction for the same content is
+# still running attach to that run instead of starting their own. Every
+# subscriber receives the full event stream, replayed from the start for late
+# joiners. The run is cancelled only once its last subscriber has gone.
+
+class Subscription:
+    """One client's attachment to a flight."""
+
+    def __init__(self, flight: "Flight"):
+        self._flight = flight
+        self._detached = False
+        flight._subscribers += 1
+
+    async def events(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yields every event of the flight from the beginning, then new ones as they arrive."""
+        flight = self._flight
+        index = 0
+        try:
+            while True:
+                while index < len(flight._events):
+                    yield flight._events[index]
+                    index += 1
+                if flight._done:
+                    return
+                await flight._changed.wait()
+        finally:
+            self.detach()
+
+    def detach(self) -> None:
+        """Leaves the flight, cancelling it if nobody else is listening. Safe to call more than once."""
+        if self._detached:
+            return
+        self._detached = True
+        self._flight._release()
+
+class Flight:
+    """A running extraction whose events are recorded for every subscriber."""
+
+    def __init__(self, key: str, registry: "SingleFlight"):
+        self.key = key
+        self._registry = registry
+        self._events: List[Dict[str, Any]] = []
+        self._done = False
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _publish(self, event: Optional[Dict[str, Any]]) -> None:
+        if event is not None:
+            self._events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _run(self, events: AsyncIterator[Dict[str, Any]]) -> None:
+        async for event in events:
+            self._publish(event)
+
+    def _finish(self, task: asyncio.Task) -> None:
+        # A done callback rather than `finally`, so it also runs if the task is cancelled before it starts
+        self._done = True
+        self._registry._finish(self)
+        self._publish(None)
+
+    def _release(self) -> None:
+        self._subscribers -= 1
+        if self._subscribers == 0 and not self._done and self._task is not None:
+            metrics.increment("extractions_cancelled")
+            logger.info(f"Last subscriber left flight {self.key[:16]}, cancelling extraction")
+            self._task.cancel()
+
+class SingleFlight:
+    """Registry of running flights by key. Only used from the event loop, so no locking is needed."""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+
+    @property
+    def active(self) -> int:
+        return len(self._flights)
+
+    def join(self, key: str) -> Optional[Subscription]:
+        """Attaches to the running flight for `key`, or returns None if there is none."""
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        metrics.increment("extractions_coalesced")
+        logger.info(f"Joining in-flight extraction {key[:16]} ({flight._subscribers} subscriber(s) already)")
+        return Subscription(flight)
+
+    def start(
+        self, key: str, events: AsyncIterator[Dict[str, Any]], on_finish: Optional[Callable[[], None]] = None
+    ) -> Subscription:
+        """
+        Starts a flight driven by `events` and returns the caller's subscription
+        to it. `on_finish` is called once the flight has ended, however it ended,
+        for resources that belong to the run rather than to any one subscriber.
+        """
+        flight = Flight(key, self)
+        subscription = Subscription(flight)
+        self._flights[key] = flight
+        flight._task = asyncio.create_task(flight._run(events))
+        flight._task.add_done_callback(flight._finish)
+        if on_finish is not None:
+            flight._task.add_done_callback(lambda task: on_finish())
+        return subscription
+
+    def _finish(self, flight: Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
@@ -0,0 +1,65 @@
+from collections import defaultdict
+from typing import Any, Dict
+import numpy as np
+from .tokens import TokenStore
+
+# Lower bound for the grid cell size, in pixels, so tiny tokens don't create huge grids.
+MIN_CELL_SIZE = 16
+
+class TokenGridIndex:
+    """
+    Uniform-grid spatial index over OCR token boxes.
+    Each token is registered in every cell its box overlaps, so a region query
+    only inspects the tokens in the cells the region covers rather than
+    scanning the whole page. Build it once after OCR and reuse it for every
+    region lookup (areas of interest, bbox snapping, highlights).
+    """
+
+    def __init__(self, tokens: TokenStore, cell_size: int = None):
+        self.tokens = tokens
+        if cell_size is None:
+            # A few lines of text per cell keeps both cell and candidate counts small.
+            heights = tokens.height[tokens.height > 0]
+            cell_size = int(4 * np.median(heights)) if len(heights) else MIN_CELL_SIZE
+        self.cell_size = max(MIN_CELL_SIZE, cell_size)
+        self._cells = defaultdict(list)
+        size = self.cell_size
+        columns = zip((tokens.left // size).tolist(), (tokens.top // size).tolist(),
+                      (tokens.right // size).tolist(), (tokens.bottom // size).tolist())
+        for i, (cx1, cy1, cx2, cy2) in enumerate(columns):
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    self._cells[(cx, cy)].append(i)
+
+    def _asdict(self) -> Dict[str, Any]:
+        """Constructor arguments; the checkpoint serializer rebuilds the grid from them."""
+        return {"tokens": self.tokens, "cell_size": self.cell_size}
+
+    def _candidates(self, bbox: Dict[str, int]) -> np.ndarray:
+        """Indices of tokens sharing at least one grid cell with `bbox`, in document order."""
+        size = self.cell_size
+        cx1, cy1 = bbox['x1'] // size, bbox['y1'] // size
+        cx2, cy2 = bbox['x2'] // size, bbox['y2'] // size
+        # Only visit cells that exist; a page-sized box would otherwise walk many empty cells.
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self._cells):
+            cells = [cell for cell in self._cells if cx1 <= cell[0] <= cx2 and cy1 <= cell[1] <= cy2]
+        else:
+            cells = [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)
+                     if (cx, cy) in self._cells]
+        if not cells:
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate([np.asarray(self._cells[cell], dtype=np.intp) for cell in cells]))
+
+    def within(self, bbox: Dict[str, int]) -> np.ndarray:
+        """Indices of tokens fully contained in `bbox`."""
+        c = self._candidates(bbox)
+        t = self.tokens
+        return c[(t.left[c] >= bbox['x1']) & (t.top[c] >= bbox['y1']) &
+                 (t.left[c] + t.width[c] <= bbox['x2']) & (t.top[c] + t.height[c] <= bbox['y2'])]
+
+    def intersecting(self, bbox: Dict[str, int]) -> np.ndarray:
+        """Indices of tokens whose box overlaps `bbox`."""
+        c = self._candidates(bbox)
+        t = self.tokens
+        return c[(t.left[c] <= bbox['x2']) & (t.top[c] <= bbox['y2']) &
+                 (t.left[c] + t.width[c] >= bbox['x1']) & (t.top[c] + t.height[c] >= bbox['y1'])]
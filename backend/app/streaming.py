@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from typing import AsyncIterator, TypeVar
+from starlette.requests import Request
+from . import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+async def stream_until_disconnected(request: Request, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    Yields items from `stream`, which is driven in its own task.
+    If the client disconnects, or the response generator is closed early,
+    that task is cancelled. The cancellation propagates into the running graph
+    and aborts any in-flight model calls instead of finishing work nobody will
+    read.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+
+    async def pump():
+        try:
+            async for item in stream:
+                await queue.put(item)
+            await queue.put(finished)
+        except asyncio.CancelledError:
+            # Extraction cancellations are counted where the run itself is cancelled (see singleflight.py)
+            logger.info("Stream cancelled before completion")
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    async def watch():
+        while not await request.is_disconnected():
+            await asyncio.sleep(config.DISCONNECT_POLL_SECONDS)
+        logger.info("Client disconnected")
+        pump_task.cancel()
+        await queue.put(finished)
+
+    pump_task = asyncio.create_task(pump())
+    watch_task = asyncio.create_task(watch())
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        watch_task.cancel()
+        if not pump_task.done():
+            pump_task.cancel()
@@ -0,0 +1,67 @@
+import math
+import logging
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+from PIL import Image
+from .tokens import TokenStore
+from .preprocess import convert_opaque
+
+logger = logging.getLogger(__name__)
+
+# --- Tiled OCR for Tall Images ---
+# The frontend stitches multi-page documents into one tall canvas. OCR'd in
+# one piece, every normalized 0-1000 unit spans several pixels and the whole
+# document comes back in one slow response. Instead the image is cut into
+# overlapping page-sized tiles that are OCR'd concurrently. Each tile "owns"
+# the band up to the middle of its overlaps, and only tokens centred in that
+# band are kept, so text in an overlap is taken once, from the tile that sees
+# it whole.
+
+def plan_tiles(width: int, height: int, tile_aspect: float, overlap: float) -> List[Dict[str, int]]:
+    """
+    Splits `height` into tiles of about `width * tile_aspect` pixels, each
+    overlapping the next by `overlap` of a tile. Returns a single tile when
+    the image is not tall enough to need splitting.
+    """
+    tile_height = int(width * tile_aspect)
+    overlap_px = int(tile_height * overlap)
+    if tile_height <= 0 or height <= tile_height + overlap_px:
+        return [{"top": 0, "bottom": height, "own_top": 0, "own_bottom": height}]
+
+    count = math.ceil((height - overlap_px) / (tile_height - overlap_px))
+    stride = (height - tile_height) / (count - 1)
+    tops = [round(i * stride) for i in range(count)]
+    tiles = [{"top": top, "bottom": min(height, top + tile_height)} for top in tops]
+    for i, tile in enumerate(tiles):
+        tile["own_top"] = 0 if i == 0 else (tile["top"] + tiles[i - 1]["bottom"]) // 2
+        tile["own_bottom"] = height if i == len(tiles) - 1 else (tiles[i + 1]["top"] + tile["bottom"]) // 2
+    return tiles
+
+def split_tiles(image_content: bytes, tile_aspect: float, overlap: float, mode: str = "RGB") -> Optional[List[Dict[str, Any]]]:
+    """
+    Cuts a tall image into JPEG tiles in the given PIL `mode`, each with its
+    `top` offset and owned band. Returns None when the image fits in a single
+    tile; only the header is read in that case.
+    """
+    image = Image.open(BytesIO(image_content))
+    width, height = image.size
+    tiles = plan_tiles(width, height, tile_aspect, overlap)
+    if len(tiles) == 1:
+        return None
+
+    logger.info(f"Splitting {width}x{height} image into {len(tiles)} OCR tiles")
+    image = convert_opaque(image, mode)
+    for tile in tiles:
+        buffer = BytesIO()
+        image.crop((0, tile["top"], width, tile["bottom"])).save(buffer, format="JPEG", quality=90)
+        tile["image_content"] = buffer.getvalue()
+    return tiles
+
+def merge_tiles(tile_tokens: List[TokenStore], tiles: List[Dict[str, Any]]) -> TokenStore:
+    """Shifts each tile's tokens into the full image's frame and keeps only those centred in the tile's owned band."""
+    stores = []
+    for tokens, tile in zip(tile_tokens, tiles):
+        tokens = tokens.shifted(dy=tile["top"])
+        center = tokens.top + tokens.height / 2
+        stores.append(tokens.select((center >= tile["own_top"]) & (center < tile["own_bottom"])))
+    return TokenStore.concat(stores)
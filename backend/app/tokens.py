@@ -0,0 +1,171 @@
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Union
+import numpy as np
+
+class TokenStore:
+    """
+    Columnar container for OCR tokens.
+    Boxes are kept in parallel int32 arrays and all token texts in a single
+    string buffer addressed by offsets, which is far smaller than a list of
+    dicts and lets region filters run as vectorized masks. Iterating or
+    indexing with an int yields the usual `{text, left, top, width, height}`
+    dict for compatibility.
+    """
+
+    __slots__ = ("left", "top", "width", "height", "_text", "_offsets")
+
+    def __init__(self, left, top, width, height, text: str, offsets):
+        self.left = np.asarray(left, dtype=np.int32)
+        self.top = np.asarray(top, dtype=np.int32)
+        self.width = np.asarray(width, dtype=np.int32)
+        self.height = np.asarray(height, dtype=np.int32)
+        self._text = text
+        self._offsets = np.asarray(offsets, dtype=np.int32)
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[str], left, top, width, height) -> "TokenStore":
+        """Builds a store from a list of texts and box columns."""
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int32, count=len(texts))
+        offsets = np.zeros(len(texts) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(left, top, width, height, "".join(texts), offsets)
+
+    @classmethod
+    def from_dicts(cls, items: Iterable[Dict[str, Any]]) -> "TokenStore":
+        """Builds a store from token dicts."""
+        items = list(items)
+        return cls.from_texts(
+            [item['text'] for item in items],
+            [item['left'] for item in items],
+            [item['top'] for item in items],
+            [item['width'] for item in items],
+            [item['height'] for item in items],
+        )
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, List[Any]]) -> "TokenStore":
+        """Inverse of `to_columns`."""
+        return cls.from_texts(columns['text'], columns['left'], columns['top'], columns['width'], columns['height'])
+
+    @classmethod
+    def concat(cls, stores: Sequence["TokenStore"]) -> "TokenStore":
+        """Concatenates several stores, preserving order."""
+        if not stores:
+            return cls.from_texts([], [], [], [], [])
+        offsets = [stores[0]._offsets]
+        base = stores[0]._offsets[-1]
+        for store in stores[1:]:
+            offsets.append(store._offsets[1:] + base)
+            base += store._offsets[-1]
+        return cls(
+            np.concatenate([store.left for store in stores]),
+            np.concatenate([store.top for store in stores]),
+            np.concatenate([store.width for store in stores]),
+            np.concatenate([store.height for store in stores]),
+            "".join(store._text for store in stores),
+            np.concatenate(offsets),
+        )
+
+    def __len__(self) -> int:
+        return len(self.left)
+
+    @property
+    def right(self) -> np.ndarray:
+        return self.left + self.width
+
+    @property
+    def bottom(self) -> np.ndarray:
+        return self.top + self.height
+
+    def text_at(self, i: int) -> str:
+        return self._text[self._offsets[i]:self._offsets[i + 1]]
+
+    def texts(self) -> List[str]:
+        offsets = self._offsets.tolist()
+        return [self._text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def __getitem__(self, key: Union[int, np.ndarray, Sequence[int]]):
+        if isinstance(key, (int, np.integer)):
+            return {
+                "text": self.text_at(key),
+                "left": int(self.left[key]),
+                "top": int(self.top[key]),
+                "width": int(self.width[key]),
+                "height": int(self.height[key]),
+            }
+        return self.select(key)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for text, left, top, width, height in zip(self.texts(), self.left.tolist(), self.top.tolist(),
+                                                  self.width.tolist(), self.height.tolist()):
+            yield {"text": text, "left": left, "top": top, "width": width, "height": height}
+
+    def select(self, key) -> "TokenStore":
+        """Returns a new store with the tokens picked by a boolean mask or an index array."""
+        indices = np.flatnonzero(key) if np.asarray(key).dtype == bool else np.asarray(key, dtype=np.intp)
+        starts = self._offsets[indices].tolist()
+        ends = self._offsets[indices + 1].tolist()
+        return TokenStore.from_texts(
+            [self._text[start:end] for start, end in zip(starts, ends)],
+            self.left[indices], self.top[indices], self.width[indices], self.height[indices],
+        )
+
+    def shifted(self, dx: int = 0, dy: int = 0) -> "TokenStore":
+        """Returns a copy translated by (dx, dy) pixels."""
+        return TokenStore(self.left + dx, self.top + dy, self.width, self.height, self._text, self._offsets)
+
+    def mask_within(self, bbox: Dict[str, int]) -> np.ndarray:
+        """Boolean mask of tokens fully contained in `bbox`."""
+        return ((self.left >= bbox['x1']) & (self.top >= bbox['y1']) &
+                (self.right <= bbox['x2']) & (self.bottom <= bbox['y2']))
+
+    def mask_intersecting(self, bbox: Dict[str, int]) -> np.ndarray:
+        """Boolean mask of tokens whose box overlaps `bbox`."""
+        return ((self.left <= bbox['x2']) & (self.top <= bbox['y2']) &
+                (self.right >= bbox['x1']) & (self.bottom >= bbox['y1']))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    def _asdict(self) -> Dict[str, Any]:
+        """Constructor arguments; lets the LangGraph checkpoint serializer store and rebuild the store."""
+        return {"left": self.left, "top": self.top, "width": self.width, "height": self.height,
+                "text": self._text, "offsets": self._offsets}
+
+    def to_columns(self) -> Dict[str, List[Any]]:
+        """Compact JSON-friendly representation, one list per field."""
+        return {
+            "text": self.texts(),
+            "left": self.left.tolist(),
+            "top": self.top.tolist(),
+            "width": self.width.tolist(),
+            "height": self.height.tolist(),
+        }
+
+def group_lines(tokens: TokenStore) -> List[List[int]]:
+    """
+    Clusters tokens into text lines by vertical center, top to bottom.
+    A token joins the current line if its center is within half a median
+    token height of the line's first token. Each line lists token indices
+    sorted left to right.
+    """
+    if len(tokens) == 0:
+        return []
+    centers = (tokens.top + tokens.height / 2).tolist()
+    tolerance = max(1.0, float(np.median(tokens.height)) / 2)
+    left = tokens.left.tolist()
+
+    lines = []
+    current = []
+    current_center = None
+    for i in np.argsort(centers, kind="stable").tolist():
+        if current and centers[i] - current_center > tolerance:
+            lines.append(current)
+            current = []
+        if not current:
+            current_center = centers[i]
+        current.append(i)
+    lines.append(current)
+
+    for line in lines:
+        line.sort(key=lambda i: left[i])
+    return lines
@@ -0,0 +1,96 @@
+import mmap
+import asyncio
+import hashlib
+import logging
+from typing import Iterable, Union
+from fastapi import UploadFile
+from starlette.formparsers import MultiPartParser
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from . import config, metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Bounded Upload Handling ---
+# Multipart file parts larger than UPLOAD_SPOOL_MAX_BYTES are spooled to a
+# temporary file while the body streams in. Uploads are read (and hashed for
+# coalescing) before admission, so a queued request keeps its upload: as bytes
+# up to that size, otherwise as a read-only memory map of the spooled file,
+# whose pages the kernel can drop under pressure. The agent gets the same map
+# instead of a bytes copy.
+MultiPartParser.spool_max_size = config.UPLOAD_SPOOL_MAX_BYTES
+
+class UploadTooLarge(Exception):
+    """Raised from the request body stream once it passes the configured limit."""
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies over `max_bytes` on the given paths with a 413.
+    A declared Content-Length is checked up front; otherwise the body is
+    counted as it streams in and the request is aborted as soon as it
+    crosses the limit, before the rest is read.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str], max_bytes: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    def _reject(self) -> JSONResponse:
+        metrics.increment("uploads_rejected_too_large")
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds the maximum size of {self.max_bytes} bytes."},
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject()(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            # Whatever error response the app builds for the aborted body is replaced by the 413
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded:
+            await self._reject()(scope, receive, send)
+
+async def read_upload(file: UploadFile) -> Union[bytes, mmap.mmap]:
+    """
+    Returns the upload's content: bytes for small uploads held in memory, or a
+    read-only memory map of the spooled temporary file for larger ones.
+    """
+    if file.size is None or file.size <= config.UPLOAD_SPOOL_MAX_BYTES:
+        return await file.read()
+    file.file.flush()
+    return mmap.mmap(file.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+async def content_digest(contents: Union[bytes, mmap.mmap]) -> str:
+    """SHA-256 of an upload; large uploads are hashed off the event loop."""
+    if len(contents) > config.UPLOAD_SPOOL_MAX_BYTES:
+        return (await asyncio.to_thread(hashlib.sha256, contents)).hexdigest()
+    return hashlib.sha256(contents).hexdigest()
@@ -0,0 +1,4 @@
+import os
+
+# app.config refuses to load without an API key; tests never call Gemini
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
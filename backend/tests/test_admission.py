@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from app.admission import AdmissionController, QueueFull
+
+def test_admits_up_to_the_limit_then_queues_then_rejects():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=2, max_queue=1)
+        first, second, third = controller.enqueue(), controller.enqueue(), controller.enqueue()
+        assert first.admitted and second.admitted and not third.admitted
+        assert (controller.active, controller.queued, third.position) == (2, 1, 1)
+        with pytest.raises(QueueFull):
+            controller.enqueue()
+
+    asyncio.run(scenario())
+
+def test_release_admits_waiters_in_order():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=2)
+        running, first, second = controller.enqueue(), controller.enqueue(), controller.enqueue()
+        positions = []
+
+        async def wait(ticket):
+            async for position in ticket.wait(poll_seconds=0.01):
+                positions.append(position)
+
+        waiting = asyncio.create_task(wait(second))
+        await asyncio.sleep(0.02)
+        running.release()
+        running.release()  # idempotent: frees one slot only
+        assert first.admitted and not second.admitted and controller.active == 1
+        await asyncio.sleep(0.02)
+        first.release()
+        await asyncio.wait_for(waiting, timeout=1)
+        assert positions == [2, 1]
+        assert second.admitted and (controller.active, controller.queued) == (1, 0)
+
+    asyncio.run(scenario())
+
+def test_releasing_a_queued_ticket_gives_up_its_place():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=2)
+        running, first, second = controller.enqueue(), controller.enqueue(), controller.enqueue()
+        first.release()
+        assert (controller.active, controller.queued, second.position) == (1, 1, 1)
+        running.release()
+        assert second.admitted and not first.admitted and controller.active == 1
+
+    asyncio.run(scenario())
+
+def test_acquire_waits_while_the_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=0)
+        running = controller.enqueue()
+        acquiring = asyncio.create_task(controller.acquire(poll_seconds=0.01))
+        await asyncio.sleep(0.03)
+        assert not acquiring.done()
+        running.release()
+        ticket = await asyncio.wait_for(acquiring, timeout=1)
+        assert ticket.admitted and controller.active == 1
+
+    asyncio.run(scenario())
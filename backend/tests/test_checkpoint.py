@@ -0,0 +1,65 @@
+import time
+import pytest
+from app.agent import build_workflow
+from app.checkpoint import build_checkpointer
+from app.spatial import TokenGridIndex
+from app.tokens import TokenStore
+
+TOKENS = TokenStore.from_dicts([
+    {"text": "Invoice", "left": 10, "top": 10, "width": 70, "height": 12},
+    {"text": "Total €", "left": 10, "top": 900, "width": 60, "height": 12},
+])
+
+def _nodes(calls, failures):
+    """Stand-ins for the graph's nodes that record their calls; a node in `failures` fails once."""
+    def node(name, update):
+        def run(state):
+            calls.append(name)
+            if failures.pop(name, False):
+                # Fail after the sibling extractors have finished, so their writes are checkpointed
+                time.sleep(0.1)
+                raise RuntimeError(f"{name}: Gemini unavailable")
+            return update(state)
+        return run
+
+    def aggregate(state):
+        # On resume these come back from the checkpoint, not from a rerun of OCR
+        assert isinstance(state["ocr_data"], TokenStore) and isinstance(state["ocr_index"], TokenGridIndex)
+        inside = state["ocr_index"].within({"x1": 0, "y1": 0, "x2": 100, "y2": 100}).tolist()
+        return {"extracted_data": {
+            "tokens": state["ocr_data"].to_dicts(),
+            "header_tokens": inside,
+            "header": state["extracted_header"],
+            "line_items": state["extracted_line_items"],
+        }}
+
+    return {
+        "extract_structured_ocr": node("extract_structured_ocr", lambda state: {
+            "ocr_data": TOKENS, "ocr_index": TokenGridIndex(TOKENS, cell_size=32), "image_content": None,
+        }),
+        "decide_aoi": node("decide_aoi", lambda state: {"areas_of_interest": {}}),
+        "extract_header_data": node("extract_header_data", lambda state: {"extracted_header": {"invoice_number": "7"}}),
+        "extract_line_items_data": node("extract_line_items_data", lambda state: {"extracted_line_items": {"line_items": []}}),
+        "extract_summary_data": node("extract_summary_data", lambda state: {"extracted_summary": None}),
+        "aggregate_results": node("aggregate_results", aggregate),
+    }
+
+def test_resume_reruns_only_the_failed_node(tmp_path):
+    calls = []
+    graph = build_workflow(_nodes(calls, {"extract_line_items_data": True})).compile(
+        checkpointer=build_checkpointer(str(tmp_path / "checkpoints.db"))
+    )
+    run_config = {"configurable": {"thread_id": "job"}}
+    with pytest.raises(RuntimeError):
+        graph.invoke({"image_content": b"invoice", "deadline": None, "resumable": True}, run_config)
+    assert "aggregate_results" not in calls and "extract_header_data" in calls
+
+    calls.clear()
+    final_state = graph.invoke(None, run_config)
+    assert calls == ["extract_line_items_data", "aggregate_results"]
+    assert final_state["extracted_data"] == {
+        "tokens": TOKENS.to_dicts(),
+        "header_tokens": [0],
+        "header": {"invoice_number": "7"},
+        "line_items": {"line_items": []},
+    }
@@ -0,0 +1,21 @@
+import asyncio
+from app.hedge import LatencyTracker, ahedged_call
+
+def test_cancelled_primary_still_counts_towards_latency():
+    latency = LatencyTracker(window=10)
+    latency.hedge_delay = lambda: 0.05
+    calls = []
+
+    async def call():
+        calls.append(None)
+        # The primary hangs; the hedge answers at once
+        await asyncio.sleep(5 if len(calls) == 1 else 0)
+        return len(calls)
+
+    async def acquire():
+        pass
+
+    result = asyncio.run(ahedged_call("test", call, latency, acquire))
+    assert result == 2
+    # The losing primary is recorded at its elapsed time, at least the hedge delay
+    assert len(latency._samples) == 1 and 0.05 <= latency._samples[0] < 1
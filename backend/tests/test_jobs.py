@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from app.jobs import JobManager, JobStore
+
+async def _events(*events, proceed: asyncio.Event = None):
+    if proceed is not None:
+        await proceed.wait()
+    for event in events:
+        yield event
+
+async def _finish(manager: JobManager, job_id: str):
+    async for _ in manager.follow(job_id):
+        pass
+    return await manager.get(job_id)
+
+def test_job_records_events_and_result(tmp_path):
+    async def scenario():
+        manager = JobManager(JobStore(str(tmp_path / "jobs.db"), max_age_seconds=3600))
+        job_id = await manager.create("standard")
+        manager.start(job_id, _events({"queued": {"position": 1}}, {"aggregate_results": {"extracted_data": {"total": 3}}}))
+        job = await _finish(manager, job_id)
+        assert (job["status"], job["result"], job["event_count"]) == ("completed", {"total": 3}, 2)
+        assert [seq for seq, _ in await asyncio.to_thread(manager.store.events, job_id, 1)] == [1]
+
+    asyncio.run(scenario())
+
+def test_concurrent_resumes_start_the_job_once(tmp_path):
+    async def scenario():
+        manager = JobManager(JobStore(str(tmp_path / "jobs.db"), max_age_seconds=3600))
+        job_id = await manager.create("standard")
+        manager.start(job_id, _events({"extract_structured_ocr": {}}, {"error": "Gemini unavailable"}))
+        job = await _finish(manager, job_id)
+        assert (job["status"], job["event_count"]) == ("failed", 2)
+
+        proceed = asyncio.Event()
+        resumed = await asyncio.gather(*[
+            manager.resume(job_id, _events({"decide_aoi": {}}, {"aggregate_results": {"extracted_data": {}}}, proceed=proceed))
+            for _ in range(3)
+        ])
+        assert sorted(resumed) == [False, False, True]
+        assert manager.running == 1
+        with pytest.raises(ValueError):
+            manager.start(job_id, _events())
+        # A running job cannot be resumed again either
+        assert not await manager.resume(job_id, _events())
+
+        proceed.set()
+        job = await _finish(manager, job_id)
+        assert (job["status"], job["event_count"], job["error"]) == ("completed", 4, None)
+        # The resumed run's events continue the job's numbering
+        assert [seq for seq, _ in await asyncio.to_thread(manager.store.events, job_id)] == [0, 1, 2, 3]
+
+    asyncio.run(scenario())
+
+def test_only_failed_or_interrupted_jobs_reopen(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), max_age_seconds=3600)
+    job_id = store.create("standard")
+    assert store.reopen(job_id) is None
+    store.finish(job_id, "completed", {"total": 1})
+    assert store.reopen(job_id) is None
+    store.finish(job_id, "interrupted", error="The server restarted before the job finished.")
+    assert store.reopen(job_id) == 0
+    assert store.get(job_id)["status"] == "queued" and store.reopen(job_id) is None
@@ -0,0 +1,48 @@
+from app.layout import analyze_layout
+from app.tokens import TokenStore
+
+def _row(top, *cells):
+    """One line of tokens given as (text, left, width), all 12px high."""
+    return [{"text": text, "left": left, "top": top, "width": width, "height": 12} for text, left, width in cells]
+
+def _item(top, description, qty, price, amount):
+    # Numbers are right-aligned under the Qty, Price and Amount headers
+    return _row(top, (description, 10, 120), (qty, 330, 10), (price, 410, 40), (amount, 520, 50))
+
+INVOICE = TokenStore.from_dicts(
+    _row(10, ("Invoice", 10, 60), ("#123", 80, 40))
+    + _row(30, ("Bill", 10, 30), ("to:", 45, 20), ("Acme", 70, 40))
+    + _row(100, ("Description", 10, 100), ("Qty", 300, 40), ("Price", 400, 50), ("Amount", 500, 70))
+    + _item(130, "Widget", "2", "5.00", "10.00")
+    + _item(160, "Gadget", "1", "50.00", "50.00")
+    # Shaped like an item, so its "Tax" anchor does not start the summary
+    + _row(190, ("Tax", 10, 30), ("preparation", 45, 90), ("1", 330, 10), ("50.00", 410, 40), ("50.00", 520, 50))
+    + _row(250, ("Subtotal", 400, 70), ("110.00", 520, 50))
+    + _row(280, ("Tax", 400, 30), ("11.00", 520, 50))
+    + _row(310, ("Total", 400, 50), ("121.00", 520, 50))
+    + _row(400, ("Thank", 10, 50), ("you", 65, 30))
+)
+
+def test_finds_header_table_and_summary():
+    areas, confidence = analyze_layout(INVOICE)
+    assert areas["header_area"] == {"x1": 10, "y1": 10, "x2": 120, "y2": 42}
+    assert areas["line_items_area"] == {"x1": 10, "y1": 100, "x2": 570, "y2": 202}
+    # Ends at the last summary anchor, leaving out the closing note
+    assert areas["summary_area"] == {"x1": 400, "y1": 250, "x2": 570, "y2": 322}
+    assert confidence == 1.0
+
+def test_anchors_match_whole_words_only():
+    tokens = TokenStore.from_dicts(
+        _row(100, ("Description", 10, 100), ("Qty", 300, 40), ("Price", 400, 50), ("Amount", 500, 70))
+        + _row(130, ("Taxi", 10, 40), ("fare", 55, 40))
+    )
+    areas, confidence = analyze_layout(tokens)
+    assert areas["summary_area"] is None
+    assert areas["line_items_area"]["y2"] == 142
+    assert confidence < 0.5
+
+def test_no_table_header_means_no_layout():
+    tokens = TokenStore.from_dicts(_row(10, ("Invoice", 10, 60)) + _row(40, ("Total", 10, 50), ("9.00", 70, 40)))
+    areas, confidence = analyze_layout(tokens)
+    assert areas == {"header_area": None, "line_items_area": None, "summary_area": None}
+    assert confidence == 0.0
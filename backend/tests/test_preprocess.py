@@ -0,0 +1,36 @@
+from io import BytesIO
+from PIL import Image, ImageDraw
+from app import config
+from app.preprocess import preprocess_image
+
+def _png(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _dark_text(mode: str, background) -> Image.Image:
+    image = Image.new(mode, (240, 60), background)
+    ImageDraw.Draw(image).text((10, 20), "TOTAL 123.45", fill=(0, 0, 0, 255) if mode == "RGBA" else 0)
+    return image
+
+def _extrema(content: bytes):
+    return Image.open(BytesIO(content)).convert("L").getextrema()
+
+def test_transparent_png_keeps_its_text(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_PREPROCESSING", True)
+    for grayscale in (True, False):
+        monkeypatch.setattr(config, "IMAGE_GRAYSCALE", grayscale)
+        # Transparent black background, as canvas exports usually have
+        low, high = _extrema(preprocess_image(_png(_dark_text("RGBA", (0, 0, 0, 0)))).content)
+        assert low < 64 and high > 192
+
+def test_palette_png_with_transparency_index_keeps_its_text(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_PREPROCESSING", True)
+    # A black background marked transparent, with near-black text
+    image = Image.new("P", (240, 60), 0)
+    image.putpalette([0, 0, 0, 20, 20, 20])
+    ImageDraw.Draw(image).text((10, 20), "TOTAL 123.45", fill=1)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", transparency=0)
+    low, high = _extrema(preprocess_image(buffer.getvalue()).content)
+    assert low < 64 and high > 192
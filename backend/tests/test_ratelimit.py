@@ -0,0 +1,40 @@
+import time
+import pytest
+from app.ratelimit import ModelRateLimiter, TokenBucket
+from app.retry import DeadlineExceeded
+
+def test_full_bucket_admits_then_makes_callers_wait_in_turn():
+    bucket = TokenBucket(60)  # one per second
+    bucket._updated = 0.0
+    assert bucket.reserve(60, now=0.0) == 0.0
+    assert bucket.reserve(1, now=0.0) == pytest.approx(1.0)
+    # A later caller queues behind the earlier reservation
+    assert bucket.reserve(1, now=0.0) == pytest.approx(2.0)
+    assert bucket.reserve(1, now=1.5) == pytest.approx(1.5)
+
+def test_refill_is_capped_at_capacity():
+    bucket = TokenBucket(60)
+    bucket._updated = 0.0
+    bucket.reserve(30, now=0.0)
+    assert bucket.utilisation(now=10.0) == pytest.approx(20 / 60, abs=1e-3)
+    assert bucket.utilisation(now=1000.0) == 0.0
+
+def test_oversized_request_waits_for_at_most_a_full_bucket():
+    bucket = TokenBucket(60)
+    bucket._updated = 0.0
+    assert bucket.reserve(1000, now=0.0) == 0.0
+    assert bucket.reserve(1000, now=0.0) == pytest.approx(60.0)
+
+def test_limiter_waits_for_the_tighter_budget():
+    limiter = ModelRateLimiter("test-model", requests_per_minute=600, tokens_per_minute=60)
+    assert limiter._reserve(60) == 0.0
+    # Requests still have budget, tokens do not
+    assert limiter._reserve(30) == pytest.approx(30.0, abs=0.1)
+
+def test_wait_past_the_deadline_is_refused_and_refunded():
+    limiter = ModelRateLimiter("test-model", requests_per_minute=60, tokens_per_minute=60)
+    limiter._reserve(60)
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(30, deadline=time.time() + 5)
+    # The refused reservation does not hold up the next caller
+    assert limiter._reserve(6) == pytest.approx(6.0, abs=0.1)
@@ -0,0 +1,45 @@
+import time
+import pytest
+from app.retry import DeadlineExceeded, RetryPolicy
+
+class Transient(Exception):
+    pass
+
+def _policy(**overrides):
+    settings = {"max_attempts": 3, "initial_backoff_seconds": 1.0, "max_backoff_seconds": 3.0,
+                "deadline_seconds": 60.0, "retry_on": lambda error: isinstance(error, Transient)}
+    return RetryPolicy(**{**settings, **overrides})
+
+def test_backoff_grows_exponentially_up_to_the_cap():
+    policy = _policy()
+    for attempt, ceiling in [(1, 1.0), (2, 2.0), (3, 3.0), (6, 3.0)]:
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling / 2
+
+def test_retries_transient_errors_until_attempts_run_out():
+    policy, started = _policy(), time.monotonic()
+    assert 0 <= policy.next_delay(Transient(), 1, started) <= 1.0
+    assert 0 <= policy.next_delay(Transient(), 2, started) <= 2.0
+    with pytest.raises(Transient):
+        policy.next_delay(Transient(), 3, started)
+
+def test_permanent_errors_are_raised_at_once():
+    with pytest.raises(ValueError):
+        _policy().next_delay(ValueError("bad request"), 1, time.monotonic())
+
+def test_policy_deadline_stops_retries():
+    policy = _policy(deadline_seconds=5.0)
+    with pytest.raises(Transient):
+        policy.next_delay(Transient(), 1, time.monotonic() - 10)
+
+def test_extraction_deadline_is_reported():
+    policy = _policy()
+    with pytest.raises(DeadlineExceeded) as exhausted:
+        policy.next_delay(Transient(), 1, time.monotonic(), deadline=time.time() - 1)
+    assert isinstance(exhausted.value.__cause__, Transient)
+    # Too little left for even the shortest backoff
+    policy = _policy(initial_backoff_seconds=10.0, max_backoff_seconds=10.0)
+    with pytest.raises(DeadlineExceeded):
+        for _ in range(20):
+            policy.next_delay(Transient(), 1, time.monotonic(), deadline=time.time() + 0.01)
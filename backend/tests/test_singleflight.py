@@ -0,0 +1,85 @@
+import asyncio
+from app.admission import AdmissionController
+from app.singleflight import SingleFlight
+
+async def _run(ticket, proceed: asyncio.Event):
+    """Like the endpoint's extraction: queue positions until admitted, then the node updates."""
+    try:
+        async for position in ticket.wait(poll_seconds=0.01):
+            yield {"queued": {"position": position}}
+        await proceed.wait()
+        yield {"node": 1}
+        yield {"node": 2}
+    except Exception as e:
+        yield {"error": str(e)}
+
+async def _collect(subscription):
+    return [event async for event in subscription.events()]
+
+def _start(flights, admission, proceed):
+    ticket = admission.enqueue()
+    return flights.start("key", _run(ticket, proceed), on_finish=ticket.release)
+
+def test_joiners_share_the_run_and_replay_its_events():
+    async def scenario():
+        flights, admission, proceed = SingleFlight(), AdmissionController(1, 1), asyncio.Event()
+        first = _start(flights, admission, proceed)
+        second = flights.join("key")
+        collecting = [asyncio.create_task(_collect(first)), asyncio.create_task(_collect(second))]
+        await asyncio.sleep(0.02)
+        proceed.set()
+        first_events, second_events = await asyncio.gather(*collecting)
+        assert first_events == second_events == [{"node": 1}, {"node": 2}]
+        assert flights.active == 0 and admission.active == 0
+        assert flights.join("key") is None
+
+    asyncio.run(scenario())
+
+def test_originator_leaving_keeps_the_run_admitted():
+    async def scenario():
+        flights, admission, proceed = SingleFlight(), AdmissionController(1, 1), asyncio.Event()
+        first = _start(flights, admission, proceed)
+        second = flights.join("key")
+        collecting = asyncio.create_task(_collect(second))
+        await asyncio.sleep(0.02)
+        first.detach()
+        # The run still holds its slot, so a new extraction has to queue
+        assert admission.active == 1
+        assert not admission.enqueue().admitted
+        proceed.set()
+        assert await collecting == [{"node": 1}, {"node": 2}]
+        assert admission.active == 1  # now held by the queued extraction
+
+    asyncio.run(scenario())
+
+def test_originator_leaving_while_queued_keeps_the_queue_place():
+    async def scenario():
+        flights, admission, proceed = SingleFlight(), AdmissionController(1, 1), asyncio.Event()
+        running = admission.enqueue()
+        first = _start(flights, admission, proceed)
+        second = flights.join("key")
+        collecting = asyncio.create_task(_collect(second))
+        await asyncio.sleep(0.02)
+        first.detach()
+        await asyncio.sleep(0.02)
+        assert admission.queued == 1
+        running.release()
+        proceed.set()
+        events = await collecting
+        assert events == [{"queued": {"position": 1}}, {"node": 1}, {"node": 2}]
+        assert (admission.active, admission.queued) == (0, 0)
+
+    asyncio.run(scenario())
+
+def test_last_subscriber_leaving_cancels_the_run_and_frees_its_slot():
+    async def scenario():
+        flights, admission, proceed = SingleFlight(), AdmissionController(1, 1), asyncio.Event()
+        first = _start(flights, admission, proceed)
+        second = flights.join("key")
+        # Cancelled before the run's task ever starts
+        first.detach()
+        second.detach()
+        await asyncio.sleep(0.02)
+        assert flights.active == 0 and admission.active == 0
+
+    asyncio.run(scenario())
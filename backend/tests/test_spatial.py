@@ -0,0 +1,20 @@
+import numpy as np
+from app.spatial import TokenGridIndex
+from app.tokens import TokenStore
+
+def test_within_matches_full_scan():
+    rng = np.random.default_rng(7)
+    count = 500
+    tokens = TokenStore.from_texts(
+        [f"t{i}" for i in range(count)],
+        rng.integers(0, 2000, count), rng.integers(0, 3000, count),
+        rng.integers(1, 120, count), rng.integers(8, 30, count),
+    )
+    index = TokenGridIndex(tokens)
+    boxes = [{"x1": 0, "y1": 0, "x2": 2200, "y2": 3100}, {"x1": 5, "y1": 5, "x2": 6, "y2": 6}]
+    for x1, y1, w, h in zip(rng.integers(0, 2000, 50), rng.integers(0, 3000, 50),
+                            rng.integers(0, 800, 50), rng.integers(0, 800, 50)):
+        boxes.append({"x1": int(x1), "y1": int(y1), "x2": int(x1 + w), "y2": int(y1 + h)})
+    for bbox in boxes:
+        assert index.within(bbox).tolist() == np.flatnonzero(tokens.mask_within(bbox)).tolist()
+        assert index.intersecting(bbox).tolist() == np.flatnonzero(tokens.mask_intersecting(bbox)).tolist()
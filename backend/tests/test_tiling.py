@@ -0,0 +1,50 @@
+from io import BytesIO
+from PIL import Image, ImageDraw
+from app.tiling import merge_tiles, plan_tiles, split_tiles
+from app.tokens import TokenStore
+
+def test_short_image_is_one_tile():
+    assert plan_tiles(1000, 1400, 1.414, 0.08) == [{"top": 0, "bottom": 1400, "own_top": 0, "own_bottom": 1400}]
+
+def test_tiles_cover_the_image_and_own_bands_partition_it():
+    tiles = plan_tiles(1000, 7000, 1.414, 0.08)
+    assert len(tiles) > 1
+    assert tiles[0]["top"] == 0 and tiles[-1]["bottom"] == 7000
+    for previous, tile in zip(tiles, tiles[1:]):
+        assert tile["top"] < previous["bottom"]
+        assert previous["own_bottom"] == tile["own_top"]
+    assert tiles[0]["own_top"] == 0 and tiles[-1]["own_bottom"] == 7000
+
+def test_merge_keeps_overlap_tokens_once():
+    tiles = plan_tiles(1000, 3000, 1.414, 0.08)
+    assert len(tiles) == 3
+    # A line at y=1350 falls in the overlap of the first two tiles, so both OCR it
+    line_top = 1350
+    tile_tokens = []
+    for tile in tiles:
+        tokens = []
+        if tile["top"] <= line_top and line_top + 20 <= tile["bottom"]:
+            tokens.append({"text": "Overlap", "left": 10, "top": line_top - tile["top"], "width": 80, "height": 20})
+        # Plus one token in the middle of the band the tile owns
+        own_middle = (tile["own_top"] + tile["own_bottom"]) // 2 - tile["top"]
+        tokens.append({"text": f"tile{tile['top']}", "left": 10, "top": own_middle, "width": 80, "height": 20})
+        tile_tokens.append(TokenStore.from_dicts(tokens))
+    assert sum("Overlap" in tokens.texts() for tokens in tile_tokens) == 2
+
+    merged = merge_tiles(tile_tokens, tiles)
+    assert merged.texts().count("Overlap") == 1
+    assert merged[merged.texts().index("Overlap")]["top"] == line_top
+    assert len(merged) == 4
+
+def test_transparent_tiles_keep_their_text():
+    image = Image.new("RGBA", (200, 1000), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for top in range(20, 1000, 100):
+        draw.text((10, top), "TOTAL 123.45", fill=(0, 0, 0, 255))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    tiles = split_tiles(buffer.getvalue(), 1.414, 0.08, mode="L")
+    assert len(tiles) > 1
+    for tile in tiles:
+        low, high = Image.open(BytesIO(tile["image_content"])).getextrema()
+        assert low < 64 and high > 192
@@ -0,0 +1,27 @@
+import numpy as np
+from app.tokens import TokenStore
+
+def _store(*tokens):
+    return TokenStore.from_dicts(
+        {"text": text, "left": left, "top": top, "width": width, "height": height}
+        for text, left, top, width, height in tokens
+    )
+
+def test_select_by_mask_and_index():
+    store = _store(("Invoice", 10, 10, 70, 12), ("#", 90, 10, 8, 12), ("", 100, 10, 0, 12), ("Total", 10, 900, 50, 12))
+    assert store.select(np.array([True, False, True, True])).texts() == ["Invoice", "", "Total"]
+    picked = store.select([3, 0])
+    assert picked.to_dicts() == [store[3], store[0]]
+
+def test_concat_keeps_texts_and_boxes_in_order():
+    first = _store(("a", 0, 0, 5, 5), ("bc", 10, 0, 10, 5))
+    second = _store(("déf", 0, 20, 15, 5))
+    merged = TokenStore.concat([first, TokenStore.concat([]), second])
+    assert merged.texts() == ["a", "bc", "déf"]
+    assert merged.to_dicts() == first.to_dicts() + second.to_dicts()
+
+def test_shifted_moves_boxes_only():
+    store = _store(("a", 1, 2, 3, 4))
+    moved = store.shifted(dx=10, dy=-2)
+    assert moved[0] == {"text": "a", "left": 11, "top": 0, "width": 3, "height": 4}
+    assert store[0]["left"] == 1
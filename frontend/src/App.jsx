@@ -359,7 +359,121 @@ function App() {
         const allImages = (await Promise.all(imagePromises)).flat();
         setImages(allImages);
 
-        if (allImages.length > 0) {
+        const uploadAndStream = async (blob, filename) => {
+            const formData = new FormData();
+            formData.append('file', blob, filename);
+            
+            try {
+                const response = await fetch(`${API_BASE_URL}/api/extract-invoice`, {
+                    method: 'POST',
+                    body: formData,
+                    signal: abortControllerRef.current.signal
+                });
+
+                if (!response.ok) {
+                    const retryAfter = response.headers.get('Retry-After');
+                    if (response.status === 413) {
+                        setError('File is too large to upload.');
+                    } else {
+                        setError(response.status === 503 && retryAfter
+                            ? `Server is busy. Please retry in ${retryAfter} seconds.`
+                            : `Failed to extract data: ${response.status} ${response.statusText}`);
+                    }
+                    setLoading(false);
+                    return;
+                }
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    
+                    // Keep the last partial line in the buffer
+                    buffer = lines.pop();
+                    
+                    for (const line of lines) {
+                        const trimmedLine = line.trim();
+                        if (!trimmedLine || !trimmedLine.startsWith('data: ')) continue;
+                        
+                        try {
+                            const data = JSON.parse(trimmedLine.substring(6));
+                            
+                            if (data.error) {
+                                setError(data.error);
+                                setLoading(false);
+                                return;
+                            }
+
+                            const nodeName = Object.keys(data)[0];
+                            const nodeData = data[nodeName];
+
+                            if (nodeName === 'queued') {
+                                setAgentStatus(`Waiting in queue (position ${nodeData.position})...`);
+                            } else if (nodeName === 'extract_structured_ocr') {
+                                setAgentStatus('Reading text...');
+                                setProgress(20);
+                            } else if (nodeName === 'decide_aoi') {
+                                setAgentStatus('Identifying layout...');
+                                setProgress(40);
+                                setAreasOfInterest(nodeData.areas_of_interest);
+                            } else if (nodeName === 'extract_header_data') {
+                                setAgentStatus('Extracting header details...');
+                                setProgress(prev => Math.max(prev, 60));
+                                setExtractedData(prev => ({ ...prev, ...nodeData.extracted_header }));
+                            } else if (nodeName === 'extract_line_items_data') {
+                                setAgentStatus('Parsing line items...');
+                                setProgress(prev => Math.max(prev, 80));
+                                setExtractedData(prev => ({
+                                    ...prev,
+                                    line_items: nodeData.extracted_line_items?.line_items || []
+                                }));
+                            } else if (nodeName === 'extract_summary_data') {
+                                setAgentStatus('Calculating totals...');
+                                setProgress(prev => Math.max(prev, 90));
+                                setExtractedData(prev => ({ ...prev, ...nodeData.extracted_summary }));
+                            } else if (nodeName === 'extract_complete_invoice') {
+                                setAgentStatus('Extracting invoice...');
+                                setProgress(prev => Math.max(prev, 80));
+                                setExtractedData(prev => ({
+                                    ...prev,
+                                    ...nodeData.extracted_header,
+                                    ...nodeData.extracted_summary,
+                                    line_items: nodeData.extracted_line_items?.line_items || []
+                                }));
+                            } else if (nodeName === 'aggregate_results') {
+                                setAgentStatus(nodeData.extracted_data?.partial
+                                    ? 'Completed with partial results (time limit reached)'
+                                    : 'Completed');
+                                setProgress(100);
+                                setExtractedData(nodeData.extracted_data);
+                                setLoading(false);
+                            }
+                        } catch (parseErr) {
+                            console.error('Error parsing SSE line:', parseErr, trimmedLine);
+                        }
+                    }
+                }
+            } catch (err) {
+                if (err.name === 'AbortError') {
+                    console.log('Fetch aborted');
+                } else {
+                    setError('Failed to extract data: ' + err.message);
+                    setLoading(false);
+                }
+            }
+        };
+
+        // A single PDF is sent as-is so the backend can read its embedded text layer
+        // instead of running vision OCR over a rasterized copy.
+        if (files.length === 1 && files[0].type === 'application/pdf' && allImages.length > 0) {
+            await uploadAndStream(files[0], files[0].name);
+        } else if (allImages.length > 0) {
             const stitchedCanvas = document.createElement('canvas');
             const ctx = stitchedCanvas.getContext('2d');
             
@@ -379,89 +493,7 @@ function App() {
                 y += img.height;
             });
             
-            stitchedCanvas.toBlob(async (blob) => {
-                const formData = new FormData();
-                formData.append('file', blob, 'invoice.jpg');
-                
-                try {
-                    const response = await fetch(`${API_BASE_URL}/api/extract-invoice`, {
-                        method: 'POST',
-                        body: formData,
-                        signal: abortControllerRef.current.signal
-                    });
-
-                    const reader = response.body.getReader();
-                    const decoder = new TextDecoder();
-                    let buffer = '';
-                    
-                    while (true) {
-                        const { value, done } = await reader.read();
-                        if (done) break;
-                        
-                        buffer += decoder.decode(value, { stream: true });
-                        const lines = buffer.split('\n');
-                        
-                        // Keep the last partial line in the buffer
-                        buffer = lines.pop();
-                        
-                        for (const line of lines) {
-                            const trimmedLine = line.trim();
-                            if (!trimmedLine || !trimmedLine.startsWith('data: ')) continue;
-                            
-                            try {
-                                const data = JSON.parse(trimmedLine.substring(6));
-                                
-                                if (data.error) {
-                                    setError(data.error);
-                                    setLoading(false);
-                                    return;
-                                }
-
-                                const nodeName = Object.keys(data)[0];
-                                const nodeData = data[nodeName];
-
-                                if (nodeName === 'extract_structured_ocr') {
-                                    setAgentStatus('Reading text...');
-                                    setProgress(20);
-                                } else if (nodeName === 'decide_aoi') {
-                                    setAgentStatus('Identifying layout...');
-                                    setProgress(40);
-                                    setAreasOfInterest(nodeData.areas_of_interest);
-                                } else if (nodeName === 'extract_header_data') {
-                                    setAgentStatus('Extracting header details...');
-                                    setProgress(60);
-                                    setExtractedData(prev => ({ ...prev, ...nodeData.extracted_header }));
-                                } else if (nodeName === 'extract_line_items_data') {
-                                    setAgentStatus('Parsing line items...');
-                                    setProgress(80);
-                                    setExtractedData(prev => ({
-                                        ...prev,
-                                        line_items: nodeData.extracted_line_items?.line_items || []
-                                    }));
-                                } else if (nodeName === 'extract_summary_data') {
-                                    setAgentStatus('Calculating totals...');
-                                    setProgress(90);
-                                    setExtractedData(prev => ({ ...prev, ...nodeData.extracted_summary }));
-                                } else if (nodeName === 'aggregate_results') {
-                                    setAgentStatus('Completed');
-                                    setProgress(100);
-                                    setExtractedData(nodeData.extracted_data);
-                                    setLoading(false);
-                                }
-                            } catch (parseErr) {
-                                console.error('Error parsing SSE line:', parseErr, trimmedLine);
-                            }
-                        }
-                    }
-                } catch (err) {
-                    if (err.name === 'AbortError') {
-                        console.log('Fetch aborted');
-                    } else {
-                        setError('Failed to extract data: ' + err.message);
-                        setLoading(false);
-                    }
-                }
-            }, 'image/jpeg');
+            stitchedCanvas.toBlob(blob => uploadAndStream(blob, 'invoice.jpg'), 'image/jpeg');
         } else {
             setLoading(false);
         }